@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import bisect
+import csv
+import ipaddress
+import itertools
+from functools import lru_cache
+
+from navv.utilities import timeit
+
+
+# Column names of the supported datasets: MaxMind GeoLite2-ASN CSV, iptoasn
+# TSV and plain start,end,asn,org CSVs
+NETWORK_COLUMNS = ["network", "cidr"]
+START_COLUMNS = ["range_start", "start", "start_ip", "first_ip"]
+END_COLUMNS = ["range_end", "end", "end_ip", "last_ip"]
+ASN_COLUMNS = ["autonomous_system_number", "asn", "as_number"]
+ORG_COLUMNS = [
+    "autonomous_system_organization",
+    "org",
+    "organization",
+    "as_description",
+    "name",
+]
+
+
+class AsnIndex:
+    """Sorted-array interval index of IP ranges to (ASN, organization).
+
+    The ranges of each IP version are kept in parallel lists sorted by their
+    first address, and are expected not to overlap, as in the MaxMind and
+    iptoasn datasets.
+    """
+
+    def __init__(self, ranges=()):
+        self.starts = {4: [], 6: []}
+        self.ends = {4: [], 6: []}
+        self.values = {4: [], 6: []}
+        for start, end, value in sorted(
+            ranges, key=lambda item: (item[0].version, int(item[0]))
+        ):
+            self.starts[start.version].append(int(start))
+            self.ends[start.version].append(int(end))
+            self.values[start.version].append(value)
+
+    def lookup_many(self, ips):
+        """Return {ip: (asn, org)} of the IPs found in the index.
+
+        The IPs are sorted, then every range list is walked once with a binary
+        search that starts where the previous IP was found.
+        """
+        found = dict()
+        addresses = {4: [], 6: []}
+        for ip in ips:
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                continue
+            addresses[address.version].append((int(address), ip))
+        for version, version_addresses in addresses.items():
+            starts, ends, values = (
+                self.starts[version],
+                self.ends[version],
+                self.values[version],
+            )
+            position = 0
+            for address, ip in sorted(version_addresses):
+                position = bisect.bisect_right(starts, address, lo=position)
+                if position and address <= ends[position - 1]:
+                    found[ip] = values[position - 1]
+        return found
+
+    def __len__(self):
+        return len(self.starts[4]) + len(self.starts[6])
+
+
+def _column(header, names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def read_asn_ranges(file_name):
+    """Yield the (first address, last address, (asn, org)) ranges of an ASN dataset.
+
+    The file is a CSV or TSV with a header naming either a network (CIDR)
+    column or start and end columns, and ASN and organization columns.
+    Headerless files are read as iptoasn's start, end, ASN, country,
+    description columns.
+    """
+    with open(file_name, newline="", encoding="utf-8", errors="replace") as f:
+        dialect = csv.excel_tab if "\t" in f.readline() else csv.excel
+        f.seek(0)
+        rows = csv.reader(f, dialect)
+        first_row = next(rows, None)
+        if first_row is None:
+            return
+        header = [column.strip().lower() for column in first_row]
+        network_column = _column(header, NETWORK_COLUMNS)
+        start_column = _column(header, START_COLUMNS)
+        end_column = _column(header, END_COLUMNS)
+        asn_column = _column(header, ASN_COLUMNS)
+        org_column = _column(header, ORG_COLUMNS)
+        if network_column is None and start_column is None:
+            # no header, iptoasn layout
+            start_column, end_column, asn_column, org_column = 0, 1, 2, -1
+            rows = itertools.chain([first_row], rows)
+
+        for row in rows:
+            try:
+                if network_column is not None:
+                    network = ipaddress.ip_network(
+                        row[network_column].strip(), strict=False
+                    )
+                    start, end = network.network_address, network.broadcast_address
+                else:
+                    start = ipaddress.ip_address(row[start_column].strip())
+                    end = ipaddress.ip_address(row[end_column].strip())
+            except (IndexError, ValueError):
+                continue
+            asn = row[asn_column].strip() if asn_column is not None else ""
+            if asn in ("", "0"):
+                # iptoasn marks unrouted ranges with AS 0
+                continue
+            org = row[org_column].strip() if org_column is not None else ""
+            yield start, end, (f"AS{asn.upper().removeprefix('AS')}", org)
+
+
+@lru_cache(maxsize=None)
+@timeit
+def get_asn_index(file_name):
+    """Load an ASN dataset into an AsnIndex once per process"""
+    return AsnIndex(read_asn_ranges(file_name))
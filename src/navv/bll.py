@@ -1,12 +1,37 @@
+from functools import lru_cache
+import ipaddress
 import json
 import os
 import pandas as pd
 
-from navv.utilities import get_mac_vendor, timeit
-from navv.validators import is_ipv4_address, is_ipv6_address
+from navv.utilities import build_mac_vendor_index, get_mac_vendor, timeit
 
 
 MAC_VENDORS_JSON_FILE = os.path.abspath(__file__ + "/../" + "data/mac-vendors.json")
+# Ports listed per pair of segments, all of them are counted
+MAX_EDGE_PORTS = 10
+
+
+@lru_cache(maxsize=None)
+def get_mac_vendor_index():
+    """Load the mac vendors json into a prefix index once per process."""
+    with open(MAC_VENDORS_JSON_FILE) as f:
+        return build_mac_vendor_index(json.load(f))
+
+
+def ip_sort_key(ip):
+    """Sort key of an IP string, IPv4 before IPv6 and in address order, anything else last"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return (float("inf"), 0, ip)
+    return (address.version, int(address), ip)
+
+
+def port_sort_key(port_and_proto):
+    """Sort key of a "port/proto" string, by port number then proto"""
+    port, _, proto = port_and_proto.partition("/")
+    return (int(port) if port.isdigit() else float("inf"), port, proto)
 
 
 def get_zeek_df(zeek_data: list, dns_data: dict):
@@ -33,172 +58,216 @@ def get_zeek_df(zeek_data: list, dns_data: dict):
     )
 
 
-@timeit
-def get_inventory_report_df(zeek_df: pd.DataFrame):
-    """Return a pandas dataframe of the inventory report data."""
-    zeek_df["port_and_proto"] = zeek_df["port"] + "/" + zeek_df["proto"]
+def get_host_fact_rows(zeek_data):
+    """Return the distinct (ip, port, proto, mac) facts of the hosts of the conn.log rows.
 
-    zeek_df["src_ipv4"] = zeek_df["src_ip"].apply(
-        lambda ip: ip if is_ipv4_address(ip) else None
-    )
-    zeek_df["src_ipv6"] = zeek_df["src_ip"].apply(
-        lambda ip: ip if is_ipv6_address(ip) else None
-    )
+    Each fact is returned as a row with the same host on both sides, which
+    gives get_inventory_report_df and get_mac_df the same result as the full
+    rows while holding only one row per fact. Used when the rows themselves
+    do not fit in memory; the facts are still kept in memory.
+    """
+    facts = set()
+    for row in zeek_data:
+        cells = row.split("\t")
+        facts.add((cells[0], cells[2], cells[3], cells[5]))
+        facts.add((cells[1], cells[2], cells[3], cells[6]))
+    return [
+        f"{ip}\t{ip}\t{port}\t{proto}\t-\t{mac}\t{mac}"
+        for ip, port, proto, mac in sorted(facts)
+    ]
 
-    zeek_df["dst_ipv4"] = zeek_df["dst_ip"].apply(
-        lambda ip: ip if is_ipv4_address(ip) else None
-    )
-    zeek_df["dst_ipv6"] = zeek_df["dst_ip"].apply(
-        lambda ip: ip if is_ipv6_address(ip) else None
-    )
 
-    src_df = zeek_df[
-        [
-            "src_mac",
-            "src_ipv4",
-            "src_hostname",
-            "src_ipv6",
-            "dst_ipv4",
-            "dst_hostname",
-            "dst_ipv6",
-            "port_and_proto",
-        ]
-    ].reset_index(drop=True)
-    src_df["mac"] = src_df["src_mac"]
+@timeit
+def get_inventory_report_df(zeek_df: pd.DataFrame, inventory=None):
+    """Return a pandas dataframe of the inventory report data.
 
-    dst_df = zeek_df[
+    Each connection contributes a (mac, ip, hostname, port, proto) fact for its
+    source and for its destination. The facts are deduplicated before they are
+    grouped per MAC, and zeek_df itself is left unchanged. The IPs, hostnames
+    and ports of each MAC are sorted, so they do not depend on the order of
+    the rows. With an InventoryIndex, each MAC also gets the name it is
+    inventoried under.
+    """
+    fact_columns = ["mac", "ip", "hostname", "port", "proto"]
+    facts = pd.concat(
         [
-            "dst_mac",
-            "src_ipv4",
-            "src_hostname",
-            "src_ipv6",
-            "dst_ipv4",
-            "dst_hostname",
-            "dst_ipv6",
-            "port_and_proto",
-        ]
-    ].reset_index(drop=True)
-    dst_df["mac"] = dst_df["dst_mac"]
-
-    df = (
-        pd.concat([src_df, dst_df])
-        .reset_index(drop=True)
-        .drop(columns=["src_mac", "dst_mac"])
-        .drop_duplicates(
-            subset=[
-                "src_ipv4",
-                "src_hostname",
-                "src_ipv6",
-                "dst_ipv4",
-                "dst_hostname",
-                "dst_ipv6",
-                "port_and_proto",
-            ]
-        )
-    )
+            zeek_df[["src_mac", "src_ip", "src_hostname", "port", "proto"]]
+            .drop_duplicates()
+            .set_axis(fact_columns, axis=1),
+            zeek_df[["dst_mac", "dst_ip", "dst_hostname", "port", "proto"]]
+            .drop_duplicates()
+            .set_axis(fact_columns, axis=1),
+        ],
+        ignore_index=True,
+    ).drop_duplicates()
 
-    grouped_df = (
-        df.groupby("mac", as_index=False)
-        .agg(
-            {
-                "src_ipv4": list,
-                "src_hostname": list,
-                "src_ipv6": list,
-                "dst_ipv4": list,
-                "dst_hostname": list,
-                "dst_ipv6": list,
-                "port_and_proto": list,
-            }
-        )
-        .reset_index()
-    )
+    ips = facts[["mac", "ip"]].drop_duplicates()
+    is_ipv6 = ips["ip"].str.contains(":", regex=False)
+    hostnames = facts.loc[facts["hostname"] != "", ["mac", "hostname"]]
+    ports = facts[["mac", "port", "proto"]].drop_duplicates()
 
-    mac_vendors = {}
-    with open(MAC_VENDORS_JSON_FILE) as f:
-        mac_vendors = json.load(f)
-    grouped_df["vendor"] = grouped_df["mac"].apply(
-        lambda mac: get_mac_vendor(mac_vendors, mac)
-    )
-    grouped_df["ipv4"] = (grouped_df["src_ipv4"] + grouped_df["dst_ipv4"]).apply(
-        lambda ip: list(set(ip))
+    grouped_df = pd.DataFrame(
+        {
+            "ipv4": ips[~is_ipv6].groupby("mac")["ip"].agg(list),
+            "ipv6": ips[is_ipv6].groupby("mac")["ip"].agg(list),
+            "hostname": hostnames.drop_duplicates()
+            .groupby("mac")["hostname"]
+            .agg(list),
+            "port_and_proto": (ports["port"] + "/" + ports["proto"])
+            .groupby(ports["mac"])
+            .agg(list),
+        },
+        index=pd.Index(sorted(facts["mac"].unique()), name="mac"),
     )
-    grouped_df["ipv6"] = (grouped_df["src_ipv6"] + grouped_df["dst_ipv6"]).apply(
-        lambda ip: list(set(ip))
+    # MACs without any value for a column get an empty list
+    for column in grouped_df.columns:
+        grouped_df[column] = grouped_df[column].map(
+            lambda values: values if isinstance(values, list) else []
+        )
+    for column in ("ipv4", "ipv6"):
+        grouped_df[column] = grouped_df[column].map(
+            lambda ips: sorted(ips, key=ip_sort_key)
+        )
+    grouped_df["hostname"] = grouped_df["hostname"].map(sorted)
+    grouped_df["port_and_proto"] = grouped_df["port_and_proto"].map(
+        lambda ports: sorted(ports, key=port_sort_key)
     )
-    grouped_df["hostname"] = (
-        grouped_df["src_hostname"] + grouped_df["dst_hostname"]
-    ).apply(lambda hostname: list(set(hostname)))
+    grouped_df = grouped_df.reset_index()
 
-    grouped_df.drop(
-        columns=[
-            "src_ipv4",
-            "src_hostname",
-            "src_ipv6",
-            "dst_ipv4",
-            "dst_hostname",
-            "dst_ipv6",
-        ],
-        inplace=True,
+    mac_vendor_index = get_mac_vendor_index()
+    grouped_df["vendor"] = grouped_df["mac"].map(
+        lambda mac: get_mac_vendor(mac_vendor_index, mac)
     )
+    if inventory is not None:
+        grouped_df["inventory_name"] = [
+            get_inventory_name(inventory, mac, ipv4 + ipv6)
+            for mac, ipv4, ipv6 in zip(
+                grouped_df["mac"], grouped_df["ipv4"], grouped_df["ipv6"]
+            )
+        ]
 
     return grouped_df
 
 
 @timeit
-def get_snmp_df(zeek_data: list):
-    """Return a pandas dataframe of the snmp.log data."""
-    zeek_data = [row.split("\t") for row in zeek_data]
+def get_snmp_df(snmp_data: list):
+    """Return a pandas dataframe of the aggregated snmp.log data."""
     return pd.DataFrame(
-        zeek_data,
+        snmp_data,
         columns=[
             "src_ip",
-            "src_port",
             "dst_ip",
             "dst_port",
             "version",
             "community",
+            "count",
+            "first_seen",
+            "last_seen",
         ],
     )
 
+
 @timeit
-def get_mac_df(zeek_df: pd.DataFrame):
-    smac_df = zeek_df[
-        [
-            "src_mac",
-            "src_ip",
-        ]
-    ].reset_index(drop=True)
+def get_mac_df(zeek_df: pd.DataFrame, inventory=None):
+    """Return a pandas dataframe of each MAC address with its unique IPs and vendor.
 
-    dmac_df = zeek_df[
-        [
-            "dst_mac",
-            "dst_ip",
+    The IPs of each MAC are sorted, so they do not depend on the order of
+    the rows. With an InventoryIndex, each MAC also gets the name it is inventoried under.
+    """
+    mac_df = (
+        pd.concat(
+            [
+                zeek_df[["src_mac", "src_ip"]]
+                .drop_duplicates()
+                .set_axis(["mac", "ip"], axis=1),
+                zeek_df[["dst_mac", "dst_ip"]]
+                .drop_duplicates()
+                .set_axis(["mac", "ip"], axis=1),
+            ],
+            ignore_index=True,
+        )
+        .drop_duplicates()
+        .groupby("mac")["ip"]
+        .agg(lambda ips: ", ".join(sorted(ips, key=ip_sort_key)))
+        .reset_index(name="associated_ip")
+    )
+
+    # Source Manufacturer column, looked up once per unique MAC
+    mac_vendor_index = get_mac_vendor_index()
+    mac_df["vendor"] = mac_df["mac"].map(
+        lambda mac: get_mac_vendor(mac_vendor_index, mac)
+    )
+    if inventory is not None:
+        mac_df["inventory_name"] = [
+            get_inventory_name(inventory, mac, ips.split(", "))
+            for mac, ips in zip(mac_df["mac"], mac_df["associated_ip"])
         ]
-    ].reset_index(drop=True)
 
-    smac_df = smac_df.rename(columns={'src_mac': 'mac', 'src_ip': 'ip'})
-    dmac_df = dmac_df.rename(columns={'dst_mac': 'mac', 'dst_ip': 'ip'})
-    mac_df = smac_df._append(dmac_df, ignore_index=True)
-    mac_df = mac_df.groupby('mac')['ip'].apply(list).reset_index(name='associated_ip')
+    return mac_df
 
-    for index, row in enumerate(mac_df.to_dict(orient="records"), start=0):
-        # Source IPs - Need to get unique values
-        ips = set(row["associated_ip"])
-        list_ips = (list(ips))
-        if len(list_ips) > 1:
-            ip_list = ', '.join([str(item) for item in list_ips])
 
-        else:
-            ip_list = list_ips[0]
+def get_inventory_name(inventory, mac, ips):
+    """Return the inventory name of the MAC or of any of its IPs, or "" """
+    item = inventory.find(ips, mac)
+    return item.name if item is not None else ""
 
-        mac_df.at[index, 'associated_ip'] = ip_list
 
-    # Source Manufacturer column
-    mac_vendors = {}
-    with open(MAC_VENDORS_JSON_FILE) as f:
-        mac_vendors = json.load(f)
-    mac_df["vendor"] = mac_df["mac"].apply(
-        lambda mac: get_mac_vendor(mac_vendors, mac)
+@timeit
+def get_segment_edges_df(segment_pairs: dict):
+    """Return a pandas dataframe of the traffic between each pair of segments.
+
+    segment_pairs is FlowStats.segment_pairs, aggregated while conn.log was
+    read, so this only has one row per pair of segments that talked.
+    """
+    edges_df = pd.DataFrame(
+        [
+            (
+                src_segment,
+                dst_segment,
+                connections,
+                total_bytes,
+                len(ports),
+                ", ".join(
+                    f"{port}/{proto}" for proto, port in sorted(ports)[:MAX_EDGE_PORTS]
+                ),
+            )
+            for (src_segment, dst_segment), (
+                connections,
+                total_bytes,
+                ports,
+            ) in segment_pairs.items()
+        ],
+        columns=[
+            "src_segment",
+            "dst_segment",
+            "connections",
+            "bytes",
+            "port_count",
+            "ports",
+        ],
     )
+    return edges_df.sort_values(
+        ["connections", "src_segment", "dst_segment"], ascending=[False, True, True]
+    ).reset_index(drop=True)
+
 
-    return mac_df
\ No newline at end of file
+def get_segment_matrix_df(edges_df: pd.DataFrame, values="connections"):
+    """Return the source by destination segment matrix of one of the edge columns.
+
+    Segments are ordered by their total traffic, busiest first, and pairs
+    that never talked are 0.
+    """
+    matrix_df = edges_df.pivot_table(
+        index="src_segment",
+        columns="dst_segment",
+        values=values,
+        aggfunc="sum",
+        fill_value=0,
+    )
+    totals = (
+        edges_df.groupby("src_segment")[values]
+        .sum()
+        .add(edges_df.groupby("dst_segment")[values].sum(), fill_value=0)
+    )
+    order = sorted(totals.index, key=lambda segment: (-totals[segment], segment))
+    return matrix_df.reindex(index=order, columns=order, fill_value=0)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import os
+from collections import Counter
+
+import openpyxl
+
+from navv import data_types
+from navv.networks import is_multicast
+from navv.spreadsheet_tools import COL_NAMES, get_segments_data
+from navv.utilities import timeit
+from navv.zeek import get_conn_data
+
+
+def get_connections(path, workers=1):
+    """Return the connection counts and segments of a NAVV workbook or a Zeek logs directory
+
+    Connections are keyed by (src_ip, dest_ip, port, proto) the way they are
+    written to the Analysis sheets, so a workbook and the logs it was made
+    from give the same keys. Logs have no segments.
+    """
+    if os.path.isdir(path):
+        return get_log_connections(path, workers=workers), []
+    return get_workbook_connections(path)
+
+
+def get_workbook_connections(file_name):
+    """Count the connections of every Analysis sheet of a NAVV workbook"""
+    connections = Counter()
+    segments = []
+    wb = openpyxl.load_workbook(file_name, read_only=True)
+    try:
+        for sheet in wb.worksheets:
+            if sheet.title == "Segments":
+                segments = get_segments_data(sheet)
+                continue
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None or list(header[: len(COL_NAMES)]) != COL_NAMES:
+                continue
+            # Count, Src_IP, Src_Desc, Dest_IP, Dest_Desc, Port, Service, Proto
+            for row in rows:
+                if row[0] is None:
+                    continue
+                connections[(row[1], row[3], int(row[5]), row[7])] += row[0]
+    finally:
+        wb.close()
+    return connections, segments
+
+
+def get_log_connections(zeek_logs, workers=1):
+    """Count the connections of the conn.log of a Zeek logs directory"""
+    conn_counts = Counter()
+    get_conn_data(zeek_logs, conn_counts=conn_counts, workers=workers)
+    connections = Counter()
+    for row, count in conn_counts.items():
+        src_ip, dest_ip, port, proto = row.split("\t", 4)[:4]
+        # the Analysis sheets name the ICMP version, see handle_service
+        if proto == "icmp":
+            proto = "ICMPv6" if ":" in src_ip else "ICMPv4"
+        connections[(src_ip, dest_ip, int(port), proto)] += count
+    return connections
+
+
+def is_external(ip, local_networks):
+    """Return True if handle_ip would list the IP on the Externals sheet"""
+    is_ipv6 = ":" in ip
+    if is_ipv6 or ip in ("0.0.0.0", "255.255.255.255") or is_multicast(ip, is_ipv6):
+        return False
+    return local_networks.lookup(ip, default=False) is False
+
+
+def service_name(services, proto, port):
+    default = "unknown icmp" if proto.startswith("ICMP") else "unknown service"
+    return services.get((proto, port), (default,))[0]
+
+
+@timeit
+def compare_connections(baseline, current, local_networks, services, **kwargs):
+    """Return the ConnectionChanges from the baseline to the current connection counts
+
+    Every set operation is done on hashed keys, so the comparison takes time
+    proportional to the number of distinct connections.
+    """
+    added = [(key, current[key]) for key in current.keys() - baseline.keys()]
+    removed = [(key, baseline[key]) for key in baseline.keys() - current.keys()]
+
+    def hosts(connections):
+        return {ip for src_ip, dest_ip, _, _ in connections for ip in (src_ip, dest_ip)}
+
+    new_hosts = sorted(hosts(current) - hosts(baseline))
+    new_external_IPs = [ip for ip in new_hosts if is_external(ip, local_networks)]
+
+    # services are the (proto, port) pairs answered by a destination
+    baseline_services = {(proto, port) for _, _, port, proto in baseline}
+    new_services = dict()
+    for (src_ip, dest_ip, port, proto), count in current.items():
+        if (proto, port) in baseline_services:
+            continue
+        servers, connections = new_services.setdefault((proto, port), (set(), [0]))
+        servers.add(dest_ip)
+        connections[0] += count
+
+    def by_count(item):
+        return (-item[1], item[0])
+
+    return data_types.ConnectionChanges(
+        baseline_connections=len(baseline),
+        current_connections=len(current),
+        added=sorted(added, key=by_count),
+        removed=sorted(removed, key=by_count),
+        new_hosts=new_hosts,
+        new_external_IPs=new_external_IPs,
+        new_services=[
+            (
+                proto,
+                port,
+                service_name(services, proto, port),
+                len(servers),
+                connections[0],
+            )
+            for (proto, port), (servers, connections) in sorted(new_services.items())
+        ],
+    )
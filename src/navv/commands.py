@@ -1,39 +1,85 @@
 """CLI Commands."""
+import csv
+import itertools
 import os
+import signal
 import webbrowser
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from time import monotonic, sleep
 
 
 # Third-Party Libraries
 import click
+import openpyxl
 
 # cisagov Libraries
 from navv.gui.app import app
-from navv.bll import get_inventory_report_df, get_snmp_df, get_zeek_df, get_mac_df
-from navv.message_handler import success_msg, warning_msg
+from navv.bll import (
+    get_host_fact_rows,
+    get_inventory_report_df,
+    get_mac_df,
+    get_mac_vendor_index,
+    get_segment_edges_df,
+    get_snmp_df,
+    get_zeek_df,
+)
+from navv.message_handler import error_msg, info_msg, success_msg, warning_msg
 from navv.spreadsheet_tools import (
-    auto_adjust_width,
+    MAX_ANALYSIS_ROWS,
     create_analysis_array,
+    get_approximation_stats,
     get_inventory_data,
     get_package_data,
     get_segments_data,
     get_workbook,
+    load_package_data,
     perform_analysis,
+    write_changes_sheet,
     write_conn_states_sheet,
     write_externals_sheet,
     write_inventory_report_sheet,
     write_snmp_sheet,
+    write_flow_stats_sheet,
+    write_segment_matrix_sheet,
     write_stats_sheet,
     write_unknown_internals_sheet,
     write_mac_sheet,
 )
 from navv.zeek import (
+    get_conn_addresses,
     get_conn_data,
     get_dns_data,
     get_snmp_data,
     run_zeek,
-    perform_zeekcut,
 )
-from navv.utilities import pushd
+from navv.asn import get_asn_index
+from navv.changes import compare_connections, get_connections
+from navv.flow_stats import FlowStats
+from navv.networks import get_local_networks
+from navv.sketches import DistinctSample, SpaceSaving
+from navv.spill import SpillingCounter
+from navv.utilities import parse_size, parse_timestamp, pushd
+from navv.watch import WatchState
+from navv.workbook_writer import save_workbook
+
+
+def validate_timestamp(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise click.BadParameter("expected epoch seconds or an ISO 8601 time")
+
+
+def validate_size(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_size(value)
+    except ValueError:
+        raise click.BadParameter("expected a size such as 512M or 2G")
 
 
 @click.command("generate")
@@ -58,46 +104,233 @@ from navv.utilities import pushd
     help="Path to store or contain zeek log files. Defaults to current working directory.",
     type=str,
 )
+@click.option(
+    "--max-analysis-rows",
+    required=False,
+    default=MAX_ANALYSIS_ROWS,
+    show_default=True,
+    help="Maximum number of rows per Analysis sheet. Additional rows continue on new sheets.",
+    type=click.IntRange(min=1, max=MAX_ANALYSIS_ROWS),
+)
+@click.option(
+    "--split-by-segment",
+    is_flag=True,
+    default=False,
+    help="Write the Analysis rows of each source segment to their own sheets.",
+)
+@click.option(
+    "-j",
+    "--workers",
+    required=False,
+    default=1,
+    show_default=True,
+    help="Number of processes used to read conn.log, enrich the Analysis rows and render the sheets when saving.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-l",
+    "--local-nets",
+    required=False,
+    multiple=True,
+    help="CIDR of an internal network in addition to the Segments sheet and private address space. Can be repeated.",
+    type=str,
+)
+@click.option(
+    "--approximate",
+    required=False,
+    metavar="ROWS",
+    help="Count connections with a fixed-size sketch that keeps the ROWS most frequent Analysis rows, and estimate the number of distinct external and unknown internal IPs. Error bounds are written to the Stats sheet.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--start",
+    required=False,
+    metavar="TIME",
+    help="Only analyze connections starting at or after TIME, in epoch seconds or ISO 8601 (UTC unless an offset is given).",
+    callback=validate_timestamp,
+)
+@click.option(
+    "--end",
+    required=False,
+    metavar="TIME",
+    help="Only analyze connections starting at or before TIME.",
+    callback=validate_timestamp,
+)
+@click.option(
+    "--asn-db",
+    required=False,
+    help="CSV or TSV of IP ranges or networks with their ASN and organization (e.g. MaxMind GeoLite2-ASN CSV or iptoasn), used to annotate the Externals sheet offline.",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--memory-limit",
+    required=False,
+    metavar="SIZE",
+    help="Memory budget of the Analysis rows and their counts, e.g. 2G. Counts beyond it are spilled to sorted files in the output directory and merged back, giving the same Analysis sheets. The counts of each conn.log chunk being read, the addresses used to filter dns.log and the per-host facts of the Inventory Report and MAC sheets are still held in memory. Cannot be combined with --approximate.",
+    callback=validate_size,
+)
+@click.option(
+    "--checkpoint-dir",
+    required=False,
+    help="Directory to save the results of every conn.log chunk in, so an interrupted run, or a later run over the same logs, only reads the chunks it is missing. The checkpoints take about as much space as the connection counts and are kept until conn.log changes.",
+    type=click.Path(file_okay=False),
+)
+@click.option(
+    "--compression-level",
+    required=False,
+    help="Deflate level of the saved workbook, from 0 (fastest, largest file) to 9 (slowest, smallest file). Defaults to zlib's default level.",
+    type=click.IntRange(min=0, max=9),
+)
 @click.argument("customer_name")
-def generate(customer_name, output_dir, pcap, zeek_logs):
+def generate(
+    customer_name,
+    output_dir,
+    pcap,
+    zeek_logs,
+    max_analysis_rows,
+    split_by_segment,
+    workers,
+    local_nets,
+    approximate,
+    start,
+    end,
+    asn_db,
+    memory_limit,
+    checkpoint_dir,
+    compression_level,
+):
     """Generate excel sheet."""
+    if approximate and memory_limit:
+        raise click.UsageError("--approximate and --memory-limit cannot be combined")
+    generate_workbook(
+        customer_name,
+        output_dir,
+        pcap,
+        zeek_logs,
+        max_analysis_rows=max_analysis_rows,
+        split_by_segment=split_by_segment,
+        workers=workers,
+        local_nets=local_nets,
+        approximate=approximate,
+        start=start,
+        end=end,
+        asn_db=asn_db,
+        memory_limit=memory_limit,
+        checkpoint_dir=checkpoint_dir,
+        compression_level=compression_level,
+    )
+
+
+def generate_workbook(
+    customer_name,
+    output_dir,
+    pcap,
+    zeek_logs,
+    max_analysis_rows=MAX_ANALYSIS_ROWS,
+    split_by_segment=False,
+    workers=1,
+    local_nets=(),
+    approximate=None,
+    start=None,
+    end=None,
+    asn_db=None,
+    conn_data=None,
+    memory_limit=None,
+    checkpoint_dir=None,
+    compression_level=None,
+):
+    """Generate the excel sheet of a customer, return its file name and the stage timings
+
+    conn_data is an optional (conn_counts, flow_stats) pair already counted
+    from conn.log, e.g. by navv watch, in which case conn.log is not read.
+    With a memory_limit in bytes, the merged connection counts are spilled to
+    disk beyond it and the rows are streamed to the Analysis sheets; the
+    per-chunk counts, the conn.log addresses and the host facts are not
+    bounded by it. The worksheets
+    are rendered in up to `workers` processes when the workbook is saved.
+    With a checkpoint_dir, the results of every conn.log chunk are saved
+    there so an interrupted run can resume.
+    """
     with pushd(output_dir):
         pass
     file_name = os.path.join(output_dir, customer_name + "_network_analysis.xlsx")
 
     wb = get_workbook(file_name)
 
-    services, conn_states = get_package_data()
+    services, conn_states, cell_styles = get_package_data()
     timer_data = dict()
-    segments = get_segments_data(wb["Segments"])
-    inventory = get_inventory_data(wb["Inventory Input"])
+    segments = get_segments_data(wb["Segments"], cell_styles)
+    inventory = get_inventory_data(wb["Inventory Input"], cell_styles)
 
     if pcap:
-        run_zeek(os.path.abspath(pcap), zeek_logs, timer=timer_data)
+        run_zeek(
+            os.path.abspath(pcap),
+            zeek_logs,
+            local_nets=[segment.network for segment in segments] + list(local_nets),
+            timer=timer_data,
+        )
     else:
         timer_data["run_zeek"] = "NOT RAN"
 
     # Get zeek data from conn.log, dns.log and snmp.log
-    zeek_data = get_conn_data(zeek_logs)
-    snmp_data = get_snmp_data(zeek_logs)
-    dns_filtered = get_dns_data(customer_name, output_dir, zeek_logs)
-
-    # Get dns data for resolution
-    json_path = os.path.join(output_dir, f"{customer_name}_dns_data.json")
+    if conn_data is None:
+        flow_stats = FlowStats(
+            get_local_networks(segments, local_nets),
+            inventory=inventory,
+            count_distinct_hosts=bool(approximate),
+        )
+        if approximate:
+            conn_counts = SpaceSaving(approximate)
+        elif memory_limit:
+            conn_counts = SpillingCounter(memory_limit, spill_dir=output_dir)
+        else:
+            conn_counts = Counter()
+        zeek_data = get_conn_data(
+            zeek_logs,
+            flow_stats,
+            conn_counts,
+            start=start,
+            end=end,
+            workers=workers,
+            checkpoint_dir=checkpoint_dir,
+            index_path=os.path.join(output_dir, f"{customer_name}_conn.log.navv-index"),
+            timer=timer_data,
+        )
+    else:
+        conn_counts, flow_stats = conn_data
+        zeek_data = list(conn_counts)
+    snmp_data = get_snmp_data(zeek_logs, timer=timer_data)
+    dns_filtered = get_dns_data(
+        customer_name,
+        output_dir,
+        zeek_logs,
+        # the kept rows do not have every host whose DNS name is needed to
+        # estimate the unknown internals
+        None if approximate else get_conn_addresses(zeek_data),
+        timer=timer_data,
+    )
 
     # Get zeek dataframes
-    zeek_df = get_zeek_df(zeek_data, dns_filtered)
+    if isinstance(conn_counts, SpillingCounter):
+        # the host reports only need the distinct facts about each host
+        zeek_df = get_zeek_df(get_host_fact_rows(zeek_data), dns_filtered)
+    else:
+        zeek_df = get_zeek_df(zeek_data, dns_filtered)
     snmp_df = get_snmp_df(snmp_data)
 
     # Get inventory report dataframe
-    inventory_df = get_inventory_report_df(zeek_df)
-    mac_df = get_mac_df(zeek_df)
+    inventory_df = get_inventory_report_df(zeek_df, inventory)
+    mac_df = get_mac_df(zeek_df, inventory)
 
     # Turn zeekcut data into rows for spreadsheet
-    rows = create_analysis_array(zeek_data, timer=timer_data)
+    rows = create_analysis_array(zeek_data, conn_counts, timer=timer_data)
 
-    ext_IPs = set()
-    unk_int_IPs = set()
+    if approximate:
+        ext_IPs = DistinctSample()
+        unk_int_IPs = DistinctSample()
+    else:
+        ext_IPs = set()
+        unk_int_IPs = set()
     perform_analysis(
         wb,
         rows,
@@ -106,15 +339,34 @@ def generate(customer_name, output_dir, pcap, zeek_logs):
         inventory,
         segments,
         dns_filtered,
-        json_path,
         ext_IPs,
         unk_int_IPs,
+        cell_styles,
+        max_rows=max_analysis_rows,
+        split_by_segment=split_by_segment,
+        workers=workers,
+        local_nets=local_nets,
         timer=timer_data,
     )
+    if approximate:
+        approximation_stats = get_approximation_stats(
+            conn_counts,
+            ext_IPs,
+            unk_int_IPs,
+            flow_stats.distinct_hosts,
+            (
+                ip
+                for ip in dns_filtered
+                if flow_stats.get_segment_name(ip) != "External"
+            ),
+        )
+    dns_filtered.close()
 
     write_inventory_report_sheet(inventory_df, wb)
 
-    write_externals_sheet(ext_IPs, wb)
+    write_externals_sheet(
+        ext_IPs, wb, get_asn_index(asn_db) if asn_db else None
+    )
 
     write_unknown_internals_sheet(unk_int_IPs, wb)
 
@@ -122,17 +374,7 @@ def generate(customer_name, output_dir, pcap, zeek_logs):
 
     write_mac_sheet(mac_df, wb)
 
-    auto_adjust_width(wb["Analysis"])
-
-    times = (
-        perform_zeekcut(fields=["ts"], log_file=os.path.join(zeek_logs, "conn.log"))
-        .decode("utf-8")
-        .split("\n")[:-1]
-    )
-    forward = sorted(times)
-    start = float(forward[0])
-    end = float(forward[len(forward) - 1])
-    cap_time = end - start
+    cap_time = flow_stats.capture_seconds
     timer_data[
         "Length of Capture time"
     ] = "{} day(s) {} hour(s) {} minutes {} seconds".format(
@@ -141,13 +383,386 @@ def generate(customer_name, output_dir, pcap, zeek_logs):
         int(cap_time % 3600 / 60),
         int(cap_time % 60),
     )
+    if approximate:
+        timer_data.update(approximation_stats)
     write_stats_sheet(wb, timer_data)
+    write_flow_stats_sheet(flow_stats, wb)
+    write_segment_matrix_sheet(get_segment_edges_df(flow_stats.segment_pairs), wb)
     write_conn_states_sheet(conn_states, wb)
 
-    wb.save(file_name)
+    save_workbook(
+        wb,
+        file_name,
+        workers=workers,
+        compression_level=compression_level,
+        timer=timer_data,
+    )
+    if isinstance(conn_counts, SpillingCounter):
+        conn_counts.close()
 
     if pcap:
         success_msg(f"Successfully created file: {file_name}")
+    return file_name, timer_data
+
+
+@click.command("watch")
+@click.option(
+    "-o",
+    "--output-dir",
+    required=False,
+    default=".",
+    help="Directory to place resultant analysis files in. Defaults to current working directory.",
+    type=str,
+)
+@click.option(
+    "-z",
+    "--zeek-logs",
+    required=False,
+    default=".",
+    help="Path of the live zeek log directory, e.g. the zeekctl spool/current directory. Defaults to current working directory.",
+    type=str,
+)
+@click.option(
+    "-j",
+    "--workers",
+    required=False,
+    default=1,
+    show_default=True,
+    help="Number of processes used to enrich the Analysis rows.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-l",
+    "--local-nets",
+    required=False,
+    multiple=True,
+    help="CIDR of an internal network in addition to the Segments sheet and private address space. Can be repeated.",
+    type=str,
+)
+@click.option(
+    "--interval",
+    required=False,
+    default=5,
+    show_default=True,
+    help="Seconds between two reads of the new conn.log lines.",
+    type=click.FloatRange(min=0.1),
+)
+@click.option(
+    "--report-interval",
+    required=False,
+    default=300,
+    show_default=True,
+    help="Seconds between two regenerations of the excel sheet, if there were new connections.",
+    type=click.FloatRange(min=1),
+)
+@click.option(
+    "--checkpoint-interval",
+    required=False,
+    default=60,
+    show_default=True,
+    help="Seconds between two saves of the watch state, if there were new connections.",
+    type=click.FloatRange(min=0),
+)
+@click.option(
+    "--asn-db",
+    required=False,
+    help="CSV or TSV of IP ranges or networks with their ASN and organization, used to annotate the Externals sheet offline.",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.argument("customer_name")
+def watch(
+    customer_name,
+    output_dir,
+    zeek_logs,
+    workers,
+    local_nets,
+    interval,
+    report_interval,
+    checkpoint_interval,
+    asn_db,
+):
+    """Follow a live zeek log directory and keep the excel sheet up to date.
+
+    Only the conn.log lines added since the last read are parsed, including
+    the end of rotated conn.*.log files. The counts and the offset reached
+    in every file are saved to <CUSTOMER_NAME>_watch_state.pkl every
+    --checkpoint-interval seconds and on Ctrl-C, so a restarted watch
+    resumes where it left off. The excel sheet is regenerated every
+    --report-interval seconds, on SIGUSR1, and on Ctrl-C before exiting.
+    """
+    with pushd(output_dir):
+        pass
+    wb = get_workbook(
+        os.path.join(output_dir, customer_name + "_network_analysis.xlsx")
+    )
+    segments = get_segments_data(wb["Segments"])
+    state = WatchState.load(
+        os.path.join(output_dir, f"{customer_name}_watch_state.pkl"),
+        FlowStats(get_local_networks(segments, local_nets)),
+        Counter(),
+    )
+    report_requested = False
+
+    def request_report(signum, frame):
+        nonlocal report_requested
+        report_requested = True
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, request_report)
+
+    def write_report():
+        """Regenerate the excel sheet, return False if it could not be written"""
+        try:
+            file_name, _ = generate_workbook(
+                customer_name,
+                output_dir,
+                None,
+                zeek_logs,
+                workers=workers,
+                local_nets=local_nets,
+                asn_db=asn_db,
+                conn_data=(state.conn_counts, state.flow_stats),
+            )
+        except Exception as e:
+            # e.g. the workbook is open in Excel, keep watching and retry later
+            warning_msg(f"Could not update the excel sheet: {type(e).__name__}: {e}")
+            return False
+        success_msg(
+            f"Updated {file_name} with {state.flow_stats.totals[0]} connections"
+        )
+        return True
+
+    info_msg(f"Watching {os.path.abspath(zeek_logs)}, press Ctrl-C to stop")
+    changed = state.flow_stats.totals[0] > 0
+    unsaved = False
+    last_report = last_save = monotonic()
+    try:
+        while True:
+            new_connections = state.poll(zeek_logs)
+            if new_connections:
+                changed = unsaved = True
+                info_msg(f"{new_connections} new connections")
+            if unsaved and monotonic() - last_save >= checkpoint_interval:
+                state.save()
+                unsaved = False
+                last_save = monotonic()
+            if report_requested or (
+                changed and monotonic() - last_report >= report_interval
+            ):
+                if write_report():
+                    changed = False
+                report_requested = False
+                last_report = monotonic()
+            sleep(interval)
+    except KeyboardInterrupt:
+        if changed or report_requested:
+            write_report()
+    finally:
+        # whatever stopped the loop, keep the connections counted so far
+        if unsaved:
+            state.save()
+
+
+@click.command("batch")
+@click.option(
+    "-o",
+    "--output-dir",
+    required=False,
+    default=".",
+    help="Output directory of the sites that don't set one, and of batch_summary.csv. Defaults to current working directory.",
+    type=str,
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    required=False,
+    default=1,
+    show_default=True,
+    help="Number of sites processed at the same time, each in its own process.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-j",
+    "--workers",
+    required=False,
+    default=1,
+    show_default=True,
+    help="Number of processes used to read conn.log and enrich the Analysis rows of each site.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--asn-db",
+    required=False,
+    help="CSV or TSV of IP ranges or networks with their ASN and organization, used to annotate the Externals sheet of every site offline.",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+def batch(manifest, output_dir, concurrency, workers, asn_db):
+    """Generate the excel sheets of every site of a CSV manifest.
+
+    The manifest has a header row and a row per site with the columns
+    customer, zeek_logs and optionally output_dir and pcap. Relative paths are
+    relative to the manifest.
+    """
+    sites = read_manifest(manifest, output_dir)
+
+    # Load the reference data before the sites are started, so the site
+    # processes inherit it instead of each loading it again
+    load_package_data()
+    get_mac_vendor_index()
+    if asn_db:
+        get_asn_index(asn_db)
+
+    if concurrency > 1 and len(sites) > 1:
+        with ProcessPoolExecutor(max_workers=concurrency) as executor:
+            results = list(
+                executor.map(
+                    generate_site,
+                    sites,
+                    itertools.repeat(workers),
+                    itertools.repeat(asn_db),
+                )
+            )
+    else:
+        results = [generate_site(site, workers, asn_db) for site in sites]
+
+    summary_file = write_batch_summary(results, output_dir)
+    failed = [result for result in results if result["status"] != "ok"]
+    for result in results:
+        if result["status"] == "ok":
+            success_msg(f"{result['customer']}: {result['seconds']} seconds")
+        else:
+            error_msg(f"{result['customer']}: {result['error']}")
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)} of {len(results)} sites failed, see {summary_file}"
+        )
+    success_msg(f"Successfully processed {len(results)} sites, see {summary_file}")
+
+
+def read_manifest(manifest, output_dir):
+    """Return the sites of a batch manifest, with their paths resolved"""
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+
+    def resolve(path):
+        return os.path.join(base_dir, path) if path else None
+
+    sites = []
+    with open(manifest, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+            if not row.get("customer"):
+                raise click.BadParameter(f"line {line} has no customer", param_hint="MANIFEST")
+            if not row.get("zeek_logs") and not row.get("pcap"):
+                raise click.BadParameter(
+                    f"line {line} has neither zeek_logs nor pcap", param_hint="MANIFEST"
+                )
+            sites.append(
+                {
+                    "customer": row["customer"],
+                    "zeek_logs": resolve(row.get("zeek_logs")) or os.getcwd(),
+                    "output_dir": resolve(row.get("output_dir")) or output_dir,
+                    "pcap": resolve(row.get("pcap")),
+                }
+            )
+    return sites
+
+
+def generate_site(site, workers=1, asn_db=None):
+    """Generate the excel sheet of a batch site and return its summary row"""
+    result = {"customer": site["customer"], "status": "ok", "error": ""}
+    started = monotonic()
+    try:
+        if not site["pcap"] and not os.path.isdir(site["zeek_logs"]):
+            raise FileNotFoundError(f"no zeek logs directory {site['zeek_logs']}")
+        result["workbook"], timer_data = generate_workbook(
+            site["customer"],
+            site["output_dir"],
+            site["pcap"],
+            site["zeek_logs"],
+            workers=workers,
+            asn_db=asn_db,
+        )
+        result.update(timer_data)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = f"{monotonic() - started:0.2f}"
+    return result
+
+
+def write_batch_summary(results, output_dir):
+    """Write the status, time and stage timings of every site to batch_summary.csv"""
+    columns = ["customer", "status", "seconds", "workbook", "error"]
+    for result in results:
+        columns.extend(column for column in result if column not in columns)
+    summary_file = os.path.join(output_dir, "batch_summary.csv")
+    with pushd(output_dir):
+        pass
+    with open(summary_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+    return summary_file
+
+
+@click.command("diff")
+@click.option(
+    "-o",
+    "--output-dir",
+    required=False,
+    default=".",
+    help="Directory to place the changes workbook in. Defaults to current working directory.",
+    type=str,
+)
+@click.option(
+    "-j",
+    "--workers",
+    required=False,
+    default=1,
+    show_default=True,
+    help="Number of processes used to read conn.log when comparing Zeek logs directories.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-l",
+    "--local-nets",
+    required=False,
+    multiple=True,
+    help="CIDR of an internal network in addition to the Segments sheets and private address space. Can be repeated.",
+    type=str,
+)
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("current", type=click.Path(exists=True))
+def diff(baseline, current, output_dir, workers, local_nets):
+    """Compare the connections of CURRENT against a BASELINE analysis.
+
+    BASELINE and CURRENT are each a NAVV workbook or a Zeek logs directory.
+    The added and removed connections, new hosts, new external IPs and new
+    services are written to the Changes sheet of <CURRENT>_changes.xlsx.
+    """
+    baseline_connections, baseline_segments = get_connections(baseline, workers)
+    current_connections, current_segments = get_connections(current, workers)
+    services, _, _ = get_package_data()
+    changes = compare_connections(
+        baseline_connections,
+        current_connections,
+        get_local_networks(current_segments or baseline_segments, local_nets),
+        services,
+    )
+
+    with pushd(output_dir):
+        pass
+    name = os.path.splitext(os.path.basename(os.path.normpath(current)))[0]
+    file_name = os.path.join(output_dir, f"{name}_changes.xlsx")
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    write_changes_sheet(changes, wb)
+    wb.save(file_name)
+    success_msg(
+        f"{len(changes.added)} added and {len(changes.removed)} removed connections, "
+        f"see {file_name}"
+    )
 
 
 @click.command("launch")
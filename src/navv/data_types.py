@@ -12,7 +12,7 @@ class InventoryItem:
     name: str
     mac_address: str
     vendor: str
-    color: str
+    color: int
 
 
 @dataclass
@@ -20,21 +20,55 @@ class Segment:
     name: str
     description: str
     network: str
-    color: str
+    color: int
 
 
-@dataclass
+@dataclass(slots=True)
 class AnalysisRowItem:
+    """One Analysis row; the *_style fields are ids of the workbook's spreadsheet_tools.CellStyles."""
+
     count: int
     src_ip: str
     dest_ip: str
     port: int
     proto: str
     conn: str
+    src_mac: str = ""
+    dest_mac: str = ""
     service: str = ""
     dest_desc: str = ""
     src_desc: str = ""
     notes: str = ""
+    src_style: int = 0
+    dest_style: int = 0
+    service_style: int = 0
+    conn_style: int = 0
+
+
+@dataclass
+class ConnectionChanges:
+    """Differences between the connections of a baseline and a current analysis.
+
+    Connections are keyed by (src_ip, dest_ip, port, proto) and counted.
+    """
+
+    baseline_connections: int
+    current_connections: int
+    added: list
+    removed: list
+    new_hosts: list
+    new_external_IPs: list
+    new_services: list
+
+
+@dataclass
+class AnalysisPartition:
+    name: str
+    key: str
+    table_name: str
+    sheet: object
+    widths: object
+    rows: int = 0
 
 
 icmp4_types = {
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+from collections.abc import Mapping
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+
+
+DNS_STORE_VERSION = "2"
+FINGERPRINT_BLOCK_SIZE = 65536
+# Reverse DNS failures are retried after this many seconds
+REVERSE_FAILURE_TTL = 24 * 3600
+# Reverse DNS results are committed every this many new lookups
+REVERSE_COMMIT_INTERVAL = 100
+
+
+def resolve_reverse(ip):
+    """Return the reverse DNS name of the IP, or "" if it does not resolve"""
+    try:
+        return socket.gethostbyaddr(ip)[0]
+    except (socket.herror, socket.gaierror):
+        return ""
+
+
+def fingerprint(log_file):
+    """Return a fingerprint of the log file from its size, mtime and first and last blocks"""
+    try:
+        stat = os.stat(log_file)
+    except OSError:
+        return ""
+    digest = hashlib.sha1()
+    with open(log_file, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BLOCK_SIZE))
+        if stat.st_size > FINGERPRINT_BLOCK_SIZE:
+            f.seek(-FINGERPRINT_BLOCK_SIZE, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{digest.hexdigest()}"
+
+
+def address_digest(addresses):
+    """Return a digest of the set of addresses the answers are filtered to, "*" for none"""
+    if addresses is None:
+        return "*"
+    digest = hashlib.sha1()
+    for address in sorted(addresses):
+        digest.update(address.encode("utf-8") + b"\n")
+    return f"{len(addresses)}:{digest.hexdigest()}"
+
+
+class DnsStore(Mapping):
+    """SQLite backed {ip: hostname} map of DNS answers with cached reverse DNS results.
+
+    Lookups are lazy: entries are read from disk the first time they are
+    requested and then kept in memory. The fingerprints of the logs the answers
+    came from, and a digest of the addresses they were filtered to, are stored
+    alongside them so the store knows when to refresh.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._names = dict()
+        self._reverse = dict()
+        self._pending_reverse = 0
+        self._create_schema()
+
+    def _create_schema(self):
+        version = None
+        try:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+            version = row[0] if row else None
+        except sqlite3.OperationalError:
+            pass
+        if version != DNS_STORE_VERSION:
+            self._conn.executescript(
+                """
+                DROP TABLE IF EXISTS meta;
+                DROP TABLE IF EXISTS sources;
+                DROP TABLE IF EXISTS names;
+                DROP TABLE IF EXISTS reverse;
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE sources (log_file TEXT PRIMARY KEY, fingerprint TEXT);
+                CREATE TABLE names (ip TEXT PRIMARY KEY, hostname TEXT) WITHOUT ROWID;
+                CREATE TABLE reverse (
+                    ip TEXT PRIMARY KEY, hostname TEXT, resolved_at REAL
+                ) WITHOUT ROWID;
+                """
+            )
+            self._conn.execute(
+                "INSERT INTO meta VALUES ('version', ?)", (DNS_STORE_VERSION,)
+            )
+            self._conn.commit()
+
+    def __getitem__(self, ip):
+        if ip not in self._names:
+            row = self._conn.execute(
+                "SELECT hostname FROM names WHERE ip = ?", (ip,)
+            ).fetchone()
+            self._names[ip] = row[0] if row else None
+        if self._names[ip] is None:
+            raise KeyError(ip)
+        return self._names[ip]
+
+    def __iter__(self):
+        for (ip,) in self._conn.execute("SELECT ip FROM names"):
+            yield ip
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+
+    def is_stale(self, log_files, addresses=None):
+        """Return True if any of the log files or the address filter changed since the store was last refreshed"""
+        stored = dict(self._conn.execute("SELECT log_file, fingerprint FROM sources"))
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'addresses'"
+        ).fetchone()
+        if row is None or row[0] != address_digest(addresses):
+            return True
+        return any(
+            stored.get(os.path.basename(log_file)) != fingerprint(log_file)
+            for log_file in log_files
+        )
+
+    def merge(self, dns_data, log_files, addresses=None):
+        """Upsert the {ip: hostname} answers and record the log files and address filter they came from"""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO names VALUES (?, ?)", dns_data.items()
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?)",
+            [
+                (os.path.basename(log_file), fingerprint(log_file))
+                for log_file in log_files
+            ],
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('addresses', ?)",
+            (address_digest(addresses),),
+        )
+        self._conn.commit()
+        self._names.update(dns_data)
+
+    def reverse_lookup(self, ip):
+        """Return the reverse DNS name of the IP, or "" if it does not resolve.
+
+        Names are cached for good, failures for REVERSE_FAILURE_TTL seconds.
+        """
+        if ip not in self._reverse:
+            row = self._conn.execute(
+                "SELECT hostname, resolved_at FROM reverse WHERE ip = ?", (ip,)
+            ).fetchone()
+            if row is None or _is_expired(*row):
+                hostname = resolve_reverse(ip)
+                self.merge_reverse({ip: hostname})
+            else:
+                hostname = row[0]
+            self._reverse[ip] = hostname
+        return self._reverse[ip]
+
+    def merge_reverse(self, reverse):
+        """Store reverse DNS results, committing them every REVERSE_COMMIT_INTERVAL results"""
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO reverse VALUES (?, ?, ?)",
+            [(ip, hostname, now) for ip, hostname in reverse.items()],
+        )
+        self._reverse.update(reverse)
+        self._pending_reverse += len(reverse)
+        if self._pending_reverse >= REVERSE_COMMIT_INTERVAL:
+            self._conn.commit()
+            self._pending_reverse = 0
+
+    def snapshot(self, ips):
+        """Return a DnsSnapshot of the names and unexpired reverse DNS results of the IPs"""
+        names = {ip: self[ip] for ip in ips if ip in self}
+        reverse = {
+            ip: hostname
+            for ip, hostname, resolved_at in self._conn.execute(
+                "SELECT ip, hostname, resolved_at FROM reverse"
+            )
+            if ip in ips and not _is_expired(hostname, resolved_at)
+        }
+        return DnsSnapshot(names, reverse)
+
+    def close(self):
+        """Commit pending reverse DNS results and close the store"""
+        self._conn.commit()
+        self._conn.close()
+
+
+def _is_expired(hostname, resolved_at):
+    """Return True for a cached reverse DNS failure older than REVERSE_FAILURE_TTL"""
+    return not hostname and time.time() - (resolved_at or 0) > REVERSE_FAILURE_TTL
+
+
+class DnsSnapshot(dict):
+    """Plain {ip: hostname} copy of part of a DnsStore that can be sent to worker processes.
+
+    Reverse DNS results looked up through the snapshot are collected so they
+    can be merged back into the store with DnsStore.merge_reverse.
+    """
+
+    def __init__(self, names, reverse):
+        super().__init__(names)
+        self.reverse = reverse
+        self.new_reverse = dict()
+
+    def reverse_lookup(self, ip):
+        """Return the reverse DNS name of the IP, or "" if it does not resolve"""
+        if ip not in self.reverse:
+            self.reverse[ip] = self.new_reverse[ip] = resolve_reverse(ip)
+        return self.reverse[ip]
+
+    def pop_new_reverse(self):
+        """Return the reverse DNS results looked up since the last call"""
+        new_reverse, self.new_reverse = self.new_reverse, dict()
+        return new_reverse
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import math
+
+from navv.networks import is_multicast
+from navv.sketches import HyperLogLog, SpaceSaving
+
+
+# conn.log fields read alongside the analysis fields to collect flow statistics
+FLOW_STAT_FIELDS = [
+    "ts",
+    "duration",
+    "orig_bytes",
+    "resp_bytes",
+    "orig_pkts",
+    "resp_pkts",
+]
+TOP_K = 50
+MIN_BUCKET_SECONDS = 60
+MAX_TIME_BUCKETS = 1440
+# IPs whose segment is remembered; the cache is emptied when it is full
+SEGMENT_CACHE_SIZE = 65536
+# (IP, MAC) pairs DistinctHosts remembers having counted
+DISTINCT_HOSTS_CACHE_SIZE = 65536
+# Order of the metrics kept for every host, port and segment
+FLOW_METRICS = [
+    "Connections",
+    "Orig Bytes",
+    "Resp Bytes",
+    "Orig Packets",
+    "Resp Packets",
+    "Duration (s)",
+]
+# The same metrics counted from the host's side of the connection
+HOST_FLOW_METRICS = [
+    "Connections",
+    "Bytes Sent",
+    "Bytes Received",
+    "Packets Sent",
+    "Packets Received",
+    "Duration (s)",
+]
+
+
+def to_number(value, cast=float):
+    """Return the zeek field as a number, treating unset ("-") and empty fields as 0"""
+    try:
+        return cast(value)
+    except ValueError:
+        return cast(0)
+
+
+class FlowStats:
+    """Streaming totals of the conn.log flows, collected while it is ingested.
+
+    Hosts and ports are kept in top-k sketches ranked by bytes, segments and
+    pairs of segments are few enough to be counted exactly, and connections
+    are counted in time buckets that double in width whenever there are more
+    than MAX_TIME_BUCKETS of them, so memory stays bounded however long the
+    capture is. The segment of every IP is looked up once and cached, as most
+    flows are between a few hosts.
+
+    With count_distinct_hosts, the external and unnamed internal hosts of
+    every flow are also counted in a DistinctHosts, see there.
+    """
+
+    def __init__(
+        self, local_networks=None, k=TOP_K, inventory=None, count_distinct_hosts=False
+    ):
+        self.local_networks = local_networks
+        self._segment_names = dict()
+        self.k = k
+        self.inventory = inventory
+        self.distinct_hosts = DistinctHosts(inventory) if count_distinct_hosts else None
+        self.totals = [0] * len(FLOW_METRICS)
+        self.first_ts = math.inf
+        self.last_ts = -math.inf
+        self.hosts = SpaceSaving(k, len(FLOW_METRICS))
+        self.ports = SpaceSaving(k, len(FLOW_METRICS))
+        self.segments = dict()
+        # (source segment, destination segment): [connections, bytes, {(proto, port)}]
+        self.segment_pairs = dict()
+        self.bucket_seconds = MIN_BUCKET_SECONDS
+        # bucket start: [connections, bytes]
+        self.buckets = dict()
+
+    def add(
+        self,
+        orig_h,
+        resp_h,
+        resp_p,
+        proto,
+        ts,
+        duration,
+        orig_bytes,
+        resp_bytes,
+        orig_pkts,
+        resp_pkts,
+        orig_mac=None,
+        resp_mac=None,
+    ):
+        """Add one conn.log flow, given as the zeek-cut field values"""
+        ts = to_number(ts)
+        duration = to_number(duration)
+        orig_bytes = to_number(orig_bytes, int)
+        resp_bytes = to_number(resp_bytes, int)
+        orig_pkts = to_number(orig_pkts, int)
+        resp_pkts = to_number(resp_pkts, int)
+        total_bytes = orig_bytes + resp_bytes
+
+        metrics = (1, orig_bytes, resp_bytes, orig_pkts, resp_pkts, duration)
+        for index, value in enumerate(metrics):
+            self.totals[index] += value
+        if ts:
+            self.first_ts = min(self.first_ts, ts)
+            self.last_ts = max(self.last_ts, ts + duration)
+            self._add_to_bucket(ts, total_bytes)
+
+        # hosts are counted from their own side: sent, received
+        self.hosts.add(orig_h, total_bytes, metrics)
+        self.hosts.add(
+            resp_h,
+            total_bytes,
+            (1, resp_bytes, orig_bytes, resp_pkts, orig_pkts, duration),
+        )
+        port = (proto, to_number(resp_p, int))
+        self.ports.add(port, total_bytes, metrics)
+
+        segment = self.get_segment_name(orig_h)
+        totals = self.segments.setdefault(segment, [0] * len(FLOW_METRICS))
+        for index, value in enumerate(metrics):
+            totals[index] += value
+
+        resp_segment = self.get_segment_name(resp_h)
+        pair = (segment, resp_segment)
+        pair_totals = self.segment_pairs.get(pair)
+        if pair_totals is None:
+            pair_totals = self.segment_pairs[pair] = [0, 0, set()]
+        pair_totals[0] += 1
+        pair_totals[1] += total_bytes
+        pair_totals[2].add(port)
+
+        if self.distinct_hosts is not None:
+            self.distinct_hosts.add(orig_h, orig_mac, segment)
+            self.distinct_hosts.add(resp_h, resp_mac, resp_segment)
+
+    @property
+    def settings(self):
+        """The arguments of an empty FlowStats collecting the same statistics"""
+        return (
+            self.local_networks,
+            self.k,
+            self.inventory,
+            self.distinct_hosts is not None,
+        )
+
+    def get_segment_name(self, ip):
+        name = self._segment_names.get(ip)
+        if name is None:
+            if len(self._segment_names) >= SEGMENT_CACHE_SIZE:
+                self._segment_names.clear()
+            name = self._segment_names[ip] = self._lookup_segment_name(ip)
+        return name
+
+    def _lookup_segment_name(self, ip):
+        if self.local_networks is None:
+            return "All"
+        network = self.local_networks.lookup(ip, default=False)
+        if network is False:
+            return "External"
+        if network is True:
+            return "Internal (no segment)"
+        return network.name
+
+    def set_local_networks(self, local_networks):
+        """Classify the flows added from now on with other local networks"""
+        self.local_networks = local_networks
+        self._segment_names = dict()
+
+    def __getstate__(self):
+        # the segment cache is not pickled with the checkpoints and watch state
+        state = self.__dict__.copy()
+        del state["_segment_names"]
+        return state
+
+    def __setstate__(self, state):
+        # states saved before the distinct hosts were counted lack them
+        self.inventory = None
+        self.distinct_hosts = None
+        self.__dict__.update(state)
+        self._segment_names = dict()
+
+    def _add_to_bucket(self, ts, total_bytes):
+        start = ts // self.bucket_seconds * self.bucket_seconds
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = [0, 0]
+        bucket[0] += 1
+        bucket[1] += total_bytes
+        if len(self.buckets) > MAX_TIME_BUCKETS:
+            self._widen_buckets()
+
+    def _widen_buckets(self):
+        self.bucket_seconds *= 2
+        self.buckets = self._rebucket(self.buckets)
+
+    def _rebucket(self, buckets):
+        rebucketed = dict()
+        for start, (connections, total_bytes) in buckets.items():
+            start = start // self.bucket_seconds * self.bucket_seconds
+            bucket = rebucketed.setdefault(start, [0, 0])
+            bucket[0] += connections
+            bucket[1] += total_bytes
+        return rebucketed
+
+    def merge(self, other):
+        """Add the flows counted by another FlowStats, e.g. of another chunk of the log"""
+        for index, value in enumerate(other.totals):
+            self.totals[index] += value
+        self.first_ts = min(self.first_ts, other.first_ts)
+        self.last_ts = max(self.last_ts, other.last_ts)
+        self.hosts.update(other.hosts)
+        self.ports.update(other.ports)
+        for segment, values in other.segments.items():
+            totals = self.segments.setdefault(segment, [0] * len(FLOW_METRICS))
+            for index, value in enumerate(values):
+                totals[index] += value
+        for pair, (connections, total_bytes, ports) in other.segment_pairs.items():
+            pair_totals = self.segment_pairs.setdefault(pair, [0, 0, set()])
+            pair_totals[0] += connections
+            pair_totals[1] += total_bytes
+            pair_totals[2].update(ports)
+
+        if self.distinct_hosts is not None and other.distinct_hosts is not None:
+            self.distinct_hosts.merge(other.distinct_hosts)
+
+        while self.bucket_seconds < other.bucket_seconds:
+            self._widen_buckets()
+        for start, (connections, total_bytes) in self._rebucket(other.buckets).items():
+            bucket = self.buckets.setdefault(start, [0, 0])
+            bucket[0] += connections
+            bucket[1] += total_bytes
+        while len(self.buckets) > MAX_TIME_BUCKETS:
+            self._widen_buckets()
+
+    @property
+    def capture_seconds(self):
+        """Seconds from the first connection start to the last connection end"""
+        if self.last_ts < self.first_ts:
+            return 0
+        return self.last_ts - self.first_ts
+
+
+class DistinctHosts:
+    """HyperLogLogs of the hosts handle_ip would list as external or unknown internal.
+
+    They are fed from every flow while conn.log is read, so the numbers of
+    distinct hosts can be estimated when the Analysis rows are only the top of
+    the traffic. DNS names are not known at that point: `unnamed_internal`
+    counts the internal hosts the inventory does not name, and the hosts named
+    by DNS are taken out with unknown_internal_estimate.
+    """
+
+    def __init__(self, inventory=None):
+        self.inventory = inventory
+        self.external = HyperLogLog()
+        self.unnamed_internal = HyperLogLog()
+        self._counted = set()
+
+    def add(self, ip, mac, segment):
+        """Count the IP of a flow, given the segment name FlowStats found for it"""
+        if (ip, mac) in self._counted:
+            return
+        if len(self._counted) >= DISTINCT_HOSTS_CACHE_SIZE:
+            self._counted.clear()
+        self._counted.add((ip, mac))
+
+        is_ipv6 = ":" in ip
+        if ip in ("0.0.0.0", "255.255.255.255") or is_multicast(ip, is_ipv6):
+            return
+        if segment == "External":
+            if not is_ipv6:
+                self.external.add(ip)
+        elif self.inventory is None or self.inventory.lookup(ip, mac) is None:
+            self.unnamed_internal.add(ip)
+
+    def merge(self, other):
+        self.external.merge(other.external)
+        self.unnamed_internal.merge(other.unnamed_internal)
+
+    def external_estimate(self):
+        """Return the estimated number of external hosts and its error"""
+        count = len(self.external)
+        return count, round(2 * self.external.relative_error * count)
+
+    def unknown_internal_estimate(self, named_ips):
+        """Return the estimated number of unnamed internal hosts DNS does not name either, and its error.
+
+        named_ips are the internal IPs DNS has a name for. The hosts left are
+        |unnamed ∪ named| - |named|, whose error is that of the union.
+        """
+        named = HyperLogLog(self.unnamed_internal.precision)
+        named_count = 0
+        for ip in named_ips:
+            named.add(ip)
+            named_count += 1
+        named.merge(self.unnamed_internal)
+        union = len(named)
+        return max(union - named_count, 0), round(2 * named.relative_error * union)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_counted"] = set()
+        return state
@@ -1,14 +1,17 @@
 import io
 import os
 import shutil
+from collections import Counter
 from tempfile import NamedTemporaryFile
 from zipfile import ZipFile
 
-import openpyxl
-
-from navv.bll import get_inventory_report_df, get_snmp_df, get_zeek_df
+from navv.bll import (
+    get_inventory_report_df,
+    get_segment_edges_df,
+    get_snmp_df,
+    get_zeek_df,
+)
 from navv.spreadsheet_tools import (
-    auto_adjust_width,
     create_analysis_array,
     get_inventory_data,
     get_package_data,
@@ -19,16 +22,20 @@ from navv.spreadsheet_tools import (
     write_externals_sheet,
     write_inventory_report_sheet,
     write_snmp_sheet,
+    write_flow_stats_sheet,
+    write_segment_matrix_sheet,
     write_stats_sheet,
     write_unknown_internals_sheet,
 )
 from navv.zeek import (
+    get_conn_addresses,
     get_conn_data,
     get_dns_data,
     get_snmp_data,
     run_zeek,
-    perform_zeekcut,
 )
+from navv.flow_stats import FlowStats
+from navv.networks import get_local_networks
 from navv.utilities import pushd
 
 
@@ -38,7 +45,7 @@ def generate(customer_name, output_dir, pcap, zeek_logs_zip, spreadsheet):
         pass
 
     if spreadsheet and spreadsheet.filename:
-        wb = openpyxl.load_workbook(os.path.join(output_dir, spreadsheet.filename))
+        wb = get_workbook(os.path.join(output_dir, spreadsheet.filename))
     else:
         file_name = os.path.join(output_dir, customer_name + "_network_analysis.xlsx")
         wb = get_workbook(file_name)
@@ -52,33 +59,43 @@ def generate(customer_name, output_dir, pcap, zeek_logs_zip, spreadsheet):
     else:
         zeek_logs = os.path.join(output_dir, "logs")
 
-    services, conn_states = get_package_data()
+    services, conn_states, cell_styles = get_package_data()
     timer_data = dict()
-    segments = get_segments_data(wb["Segments"])
-    inventory = get_inventory_data(wb["Inventory Input"])
+    segments = get_segments_data(wb["Segments"], cell_styles)
+    inventory = get_inventory_data(wb["Inventory Input"], cell_styles)
 
     if pcap and pcap.filename:
-        run_zeek(os.path.join(output_dir, pcap.filename), zeek_logs, timer=timer_data)
+        run_zeek(
+            os.path.join(output_dir, pcap.filename),
+            zeek_logs,
+            local_nets=[segment.network for segment in segments],
+            timer=timer_data,
+        )
     else:
         timer_data["run_zeek"] = "NOT RAN"
 
     # Get zeek data from conn.log, dns.log and snmp.log
-    zeek_data = get_conn_data(zeek_logs)
-    snmp_data = get_snmp_data(zeek_logs)
-    dns_filtered = get_dns_data(customer_name, output_dir, zeek_logs)
-
-    # Get dns data for resolution
-    json_path = os.path.join(output_dir, f"{customer_name}_dns_data.json")
+    flow_stats = FlowStats(get_local_networks(segments))
+    conn_counts = Counter()
+    zeek_data = get_conn_data(zeek_logs, flow_stats, conn_counts, timer=timer_data)
+    snmp_data = get_snmp_data(zeek_logs, timer=timer_data)
+    dns_filtered = get_dns_data(
+        customer_name,
+        output_dir,
+        zeek_logs,
+        get_conn_addresses(zeek_data),
+        timer=timer_data,
+    )
 
     # Get zeek dataframes
     zeek_df = get_zeek_df(zeek_data, dns_filtered)
     snmp_df = get_snmp_df(snmp_data)
 
     # Get inventory report dataframe
-    inventory_df = get_inventory_report_df(zeek_df)
+    inventory_df = get_inventory_report_df(zeek_df, inventory)
 
     # Turn zeekcut data into rows for spreadsheet
-    rows = create_analysis_array(zeek_data, timer=timer_data)
+    rows = create_analysis_array(zeek_data, conn_counts, timer=timer_data)
 
     ext_IPs = set()
     unk_int_IPs = set()
@@ -90,11 +107,12 @@ def generate(customer_name, output_dir, pcap, zeek_logs_zip, spreadsheet):
         inventory,
         segments,
         dns_filtered,
-        json_path,
         ext_IPs,
         unk_int_IPs,
+        cell_styles,
         timer=timer_data,
     )
+    dns_filtered.close()
 
     write_inventory_report_sheet(inventory_df, wb)
 
@@ -104,16 +122,7 @@ def generate(customer_name, output_dir, pcap, zeek_logs_zip, spreadsheet):
 
     write_snmp_sheet(snmp_df, wb)
 
-    auto_adjust_width(wb["Analysis"])
-    times = (
-        perform_zeekcut(fields=["ts"], log_file=os.path.join(zeek_logs, "conn.log"))
-        .decode("utf-8")
-        .split("\n")[:-1]
-    )
-    forward = sorted(times)
-    start = float(forward[0])
-    end = float(forward[len(forward) - 1])
-    cap_time = end - start
+    cap_time = flow_stats.capture_seconds
     timer_data[
         "Length of Capture time"
     ] = "{} day(s) {} hour(s) {} minutes {} seconds".format(
@@ -123,6 +132,8 @@ def generate(customer_name, output_dir, pcap, zeek_logs_zip, spreadsheet):
         int(cap_time % 60),
     )
     write_stats_sheet(wb, timer_data)
+    write_flow_stats_sheet(flow_stats, wb)
+    write_segment_matrix_sheet(get_segment_edges_df(flow_stats.segment_pairs), wb)
     write_conn_states_sheet(conn_states, wb)
 
     memfile: io.BytesIO
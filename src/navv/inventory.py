@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import ipaddress
+
+from navv.networks import PrefixIndex
+from navv.validators import is_mac_address
+
+
+def normalize_mac(mac_address):
+    """Return the MAC address in lowercase, colon separated form"""
+    return mac_address.strip().lower().replace("-", ":")
+
+
+class InventoryIndex:
+    """Inventory items indexed by IP address, MAC address and network.
+
+    Items keyed by an IP or a MAC are found with a dict lookup, items keyed by
+    a CIDR with a longest-prefix match in a PrefixIndex. An exact IP wins over
+    a MAC, which wins over a network.
+    """
+
+    def __init__(self):
+        self.by_ip = dict()
+        self.by_mac = dict()
+        self.by_network = PrefixIndex()
+        self.size = 0
+
+    def add(self, key, item):
+        """Index the item under an IP address, a CIDR or a MAC address"""
+        key = str(key).strip()
+        if is_mac_address(key):
+            self.by_mac[normalize_mac(key)] = item
+        elif "/" in key:
+            self.by_network.add(key, item)
+        else:
+            self.by_ip[str(ipaddress.ip_address(key))] = item
+        self.size += 1
+
+    def lookup(self, ip=None, mac=None):
+        """Return the item of the IP or MAC address, or None"""
+        return self.find([ip] if ip else [], mac)
+
+    def find(self, ips=(), mac=None):
+        """Return the most specific item of any of the IPs or of the MAC, or None"""
+        for ip in ips:
+            if ip in self.by_ip:
+                return self.by_ip[ip]
+        if mac and self.by_mac:
+            item = self.by_mac.get(normalize_mac(mac))
+            if item is not None:
+                return item
+        for ip in ips:
+            item = self.by_network.lookup(ip)
+            if item is not None:
+                return item
+        return None
+
+    def __contains__(self, ip):
+        return self.lookup(ip) is not None
+
+    def __len__(self):
+        return self.size
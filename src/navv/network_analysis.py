@@ -9,7 +9,7 @@ import pkg_resources
 import click
 
 # package imports
-from navv.commands import generate, launch
+from navv.commands import batch, diff, generate, launch, watch
 from navv.message_handler import info_msg
 from navv._version import __version__
 
@@ -34,7 +34,10 @@ def main():
     """Main function for performing zeek-cut commands and sorting the output"""
 
     cli.add_command(generate)
+    cli.add_command(batch)
+    cli.add_command(diff)
     cli.add_command(launch)
+    cli.add_command(watch)
     cli()
 
 
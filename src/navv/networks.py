@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import ipaddress
+import itertools
+
+
+# Private IPv4 space and IPv6 unique local and link-local space
+PRIVATE_NETS = [
+    "10.0.0.0/8",
+    "172.16.0.0/12",
+    "192.168.0.0/16",
+    "fc00::/7",
+    "fe80::/10",
+]
+
+
+class PrefixIndex:
+    """Longest-prefix match index of IPv4 and IPv6 networks.
+
+    Networks are kept in one dict per IP version and prefix length, keyed by
+    the network bits, so a lookup is one dict probe per prefix length in use.
+    """
+
+    def __init__(self, networks=()):
+        self.tables = {4: dict(), 6: dict()}
+        self.prefixlens = {4: [], 6: []}
+        for network, value in networks:
+            self.add(network, value)
+
+    def add(self, network, value):
+        """Map the network (CIDR string) to value, replacing an equal network"""
+        network = ipaddress.ip_network(network, strict=False)
+        tables = self.tables[network.version]
+        network_bits = int(network.network_address) >> (
+            network.max_prefixlen - network.prefixlen
+        )
+        tables.setdefault(network.prefixlen, dict())[network_bits] = value
+        self.prefixlens[network.version] = sorted(tables, reverse=True)
+
+    def lookup(self, ip, default=None):
+        """Return the value of the most specific network containing the IP"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return default
+        tables = self.tables[address.version]
+        host_bits = address.max_prefixlen
+        address_bits = int(address)
+        for prefixlen in self.prefixlens[address.version]:
+            table = tables[prefixlen]
+            network_bits = address_bits >> (host_bits - prefixlen)
+            if network_bits in table:
+                return table[network_bits]
+        return default
+
+    def __contains__(self, ip):
+        return self.lookup(ip, default=None) is not None
+
+
+PRIVATE_NETWORKS = PrefixIndex((network, True) for network in PRIVATE_NETS)
+
+
+def get_local_networks(segments, local_nets=()):
+    """Return a PrefixIndex of the internal address space.
+
+    Segments map to their Segment, the private and extra local networks map to
+    True. A segment wins over a local network of the same size.
+    """
+    local_networks = PrefixIndex(
+        (network, True) for network in itertools.chain(PRIVATE_NETS, local_nets)
+    )
+    for segment in segments:
+        local_networks.add(segment.network, segment)
+    return local_networks
+
+
+def is_multicast(ip, is_ipv6):
+    """Return True if the IP is in 224.0.0.0/4 or ff00::/8"""
+    if is_ipv6:
+        return ip[:2].lower() == "ff"
+    return 224 <= int(ip.split(".", 1)[0]) <= 239
+
+
+def to_zeek_subnet(network):
+    """Return the network in Zeek subnet literal syntax"""
+    network = ipaddress.ip_network(network, strict=False)
+    if network.version == 6:
+        return f"[{network.network_address}]/{network.prefixlen}"
+    return str(network)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import hashlib
+import heapq
+import math
+
+
+HLL_PRECISION = 14
+DISTINCT_SAMPLE_SIZE = 100_000
+
+
+class SpaceSaving:
+    """Weighted space-saving sketch of the top k keys by weight.
+
+    At most k keys are tracked. A new key replaces the key with the lowest
+    weight and inherits that weight as its error, so the reported weight of a
+    key is an upper bound that overestimates by at most its error, and never
+    by more than total / k. The other metrics of a key are only counted from
+    the time it entered the sketch.
+    """
+
+    def __init__(self, k, metrics=0):
+        self.k = k
+        self.metrics = metrics
+        self.total = 0
+        # key: [weight, error, *metrics]
+        self.counters = dict()
+        # (weight, key) min-heap with one entry per key, pushed when the key
+        # enters; weights only grow, so an entry is a lower bound of its key's
+        # weight and is refreshed when it reaches the top
+        self._heap = []
+
+    def add(self, key, weight=1, metrics=()):
+        self.total += weight
+        entry = self.counters.get(key)
+        if entry is None:
+            if len(self.counters) < self.k:
+                entry = [0, 0] + [0] * self.metrics
+            else:
+                min_weight, min_key = self._pop_min()
+                del self.counters[min_key]
+                entry = [min_weight, min_weight] + [0] * self.metrics
+            self.counters[key] = entry
+            entry[0] += weight
+            heapq.heappush(self._heap, (entry[0], key))
+        else:
+            entry[0] += weight
+        for index, value in enumerate(metrics, start=2):
+            entry[index] += value
+
+    def _pop_min(self):
+        while True:
+            weight, key = heapq.heappop(self._heap)
+            current = self.counters[key][0]
+            if current == weight:
+                return weight, key
+            heapq.heappush(self._heap, (current, key))
+
+    def update(self, other):
+        """Add the counts of another sketch, keeping the k heaviest keys
+
+        A key missing from one of the sketches may still have been counted
+        there up to its lowest tracked weight, which is added to both the
+        weight and the error so the weights stay upper bounds.
+        """
+        own_floor, other_floor = self._floor(), other._floor()
+        empty = [0] * self.metrics
+        merged = dict()
+        for key in self.counters.keys() | other.counters.keys():
+            own = self.counters.get(key, [own_floor, own_floor] + empty)
+            theirs = other.counters.get(key, [other_floor, other_floor] + empty)
+            merged[key] = [a + b for a, b in zip(own, theirs)]
+        self.counters = dict(
+            sorted(merged.items(), key=lambda item: (-item[1][0], item[0]))[: self.k]
+        )
+        self.total += other.total
+        self._heap = [(entry[0], key) for key, entry in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def _floor(self):
+        if len(self.counters) < self.k:
+            return 0
+        return min(entry[0] for entry in self.counters.values())
+
+    def items(self):
+        """Return the (key, weight) of the tracked keys"""
+        return [(key, entry[0]) for key, entry in self.counters.items()]
+
+    def __iter__(self):
+        return iter(self.counters)
+
+    def __len__(self):
+        return len(self.counters)
+
+    @property
+    def max_error(self):
+        """Largest overestimate of the weight of any tracked key"""
+        return max((entry[1] for entry in self.counters.values()), default=0)
+
+    def top(self):
+        """Return the (key, weight, error, metrics) of the tracked keys, heaviest first"""
+        return [
+            (key, entry[0], entry[1], entry[2:])
+            for key, entry in sorted(
+                self.counters.items(), key=lambda item: (-item[1][0], item[0])
+            )
+        ]
+
+
+class HyperLogLog:
+    """Estimate the number of distinct values added, in 2 ** precision bytes"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        hashed = int.from_bytes(
+            hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big"
+        )
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """Add the values counted by another HyperLogLog of the same precision"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    @property
+    def relative_error(self):
+        """Standard error of the estimate, relative to the true count"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def __len__(self):
+        registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        estimate = (
+            alpha
+            * registers ** 2
+            / sum(2.0 ** -register for register in self.registers)
+        )
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * registers and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = registers * math.log(registers / zeros)
+        return round(estimate)
+
+
+class DistinctSample:
+    """Set-like collection that keeps at most sample_size values.
+
+    Every value added is counted by a HyperLogLog, so len() estimates the
+    number of distinct values even once the sample is full. Iterating yields
+    the sampled values, the first distinct values seen.
+    """
+
+    def __init__(self, sample_size=DISTINCT_SAMPLE_SIZE, precision=HLL_PRECISION):
+        self.sample_size = sample_size
+        self.sample = set()
+        self.cardinality = HyperLogLog(precision)
+
+    def add(self, value):
+        self.cardinality.add(value)
+        if len(self.sample) < self.sample_size:
+            self.sample.add(value)
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        return value in self.sample
+
+    def __iter__(self):
+        return iter(self.sample)
+
+    def __len__(self):
+        # below the sample size the sample is exact
+        if len(self.sample) < self.sample_size:
+            return len(self.sample)
+        return max(len(self.cardinality), len(self.sample))
+
+    @property
+    def is_exact(self):
+        return len(self.sample) < self.sample_size
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import heapq
+import itertools
+import os
+import sys
+import tempfile
+
+
+# Rough size of a dict entry and its int count, on top of the key itself
+ENTRY_OVERHEAD = 120
+# Runs merged at once; past this many the runs are merged into one first, so
+# the number of open files stays bounded
+MAX_OPEN_RUNS = 64
+
+
+class SpillingCounter:
+    """Counter of string rows that keeps at most about memory_limit bytes in memory.
+
+    Rows are counted in a dict until its estimated size passes the budget,
+    then the counts are written to disk as a run sorted by row and the dict
+    starts over. Reading the counts back merges the runs and what is still
+    in memory with a k-way merge, adding up the counts of equal rows, so
+    peak memory depends on the budget and the number of runs rather than on
+    the number of distinct rows.
+    """
+
+    def __init__(self, memory_limit, spill_dir=None):
+        self.memory_limit = memory_limit
+        self._temp_dir = tempfile.TemporaryDirectory(
+            prefix="navv_spill_", dir=spill_dir
+        )
+        self.counts = dict()
+        self.size = 0
+        self.runs = []
+        self._run_number = 0
+
+    def __setitem__(self, row, count):
+        if row not in self.counts:
+            self.size += sys.getsizeof(row) + ENTRY_OVERHEAD
+        self.counts[row] = count
+        if self.size > self.memory_limit:
+            self.spill()
+
+    def __getitem__(self, row):
+        # only the in-memory part, which is all += needs
+        return self.counts.get(row, 0)
+
+    def add(self, row, count=1):
+        self[row] = self[row] + count
+
+    def spill(self):
+        """Write the in-memory counts to disk as a run sorted by row"""
+        if not self.counts:
+            return
+        self.runs.append(self._write_run(sorted(self.counts.items()), "rows"))
+        self.counts = dict()
+        self.size = 0
+        if len(self.runs) >= MAX_OPEN_RUNS:
+            runs, self.runs = self.runs, []
+            self.runs.append(self._write_run(self._merge_rows(runs), "rows"))
+            self._remove(runs)
+
+    def _write_run(self, items, kind):
+        self._run_number += 1
+        path = os.path.join(self._temp_dir.name, f"{kind}-{self._run_number}")
+        with open(path, "wb") as f:
+            for row, count in items:
+                f.write(b"%s\t%d\n" % (row.encode("utf-8"), count))
+        return path
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, "rb") as f:
+            for line in f:
+                row, count = line[:-1].rsplit(b"\t", 1)
+                yield row.decode("utf-8"), int(count)
+
+    def _merge_rows(self, runs, counts=()):
+        merged = heapq.merge(
+            *(self._read_run(path) for path in runs),
+            iter(counts),
+            key=lambda item: item[0],
+        )
+        for row, group in itertools.groupby(merged, key=lambda item: item[0]):
+            yield row, sum(count for _, count in group)
+
+    @staticmethod
+    def _remove(runs):
+        for path in runs:
+            os.remove(path)
+
+    def items(self):
+        """Yield every (row, count), sorted by row, with the counts of all runs added up"""
+        return self._merge_rows(self.runs, sorted(self.counts.items()))
+
+    def __iter__(self):
+        return (row for row, _ in self.items())
+
+    def most_common_items(self):
+        """Yield every (row, count) by decreasing count, then by row, sorting on disk if needed
+
+        This is the order of the Analysis sheet. The merged counts are cut
+        into runs that fit the budget, each run is sorted by (-count, row),
+        and the runs are merged again.
+        """
+        if not self.runs:
+            yield from sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+            return
+
+        def by_count(item):
+            return (-item[1], item[0])
+
+        runs = []
+        buffer = []
+        size = 0
+        for row, count in self.items():
+            buffer.append((row, count))
+            size += sys.getsizeof(row) + ENTRY_OVERHEAD
+            if size > self.memory_limit:
+                runs.append(self._write_run(sorted(buffer, key=by_count), "counts"))
+                buffer = []
+                size = 0
+                if len(runs) >= MAX_OPEN_RUNS:
+                    merged = heapq.merge(
+                        *(self._read_run(path) for path in runs), key=by_count
+                    )
+                    merged_run = self._write_run(merged, "counts")
+                    self._remove(runs)
+                    runs = [merged_run]
+        buffer.sort(key=by_count)
+        try:
+            yield from heapq.merge(
+                *(self._read_run(path) for path in runs), iter(buffer), key=by_count
+            )
+        finally:
+            self._remove(runs)
+
+    def close(self):
+        """Remove the spilled runs"""
+        self._temp_dir.cleanup()
+        self.runs = []
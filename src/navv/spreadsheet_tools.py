@@ -2,25 +2,34 @@
 
 # Copyright 2023 Battelle Energy Alliance, LLC
 
+import datetime
 import os
 import itertools
-from collections import Counter
-import socket
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy
-import json
+from functools import lru_cache
 import pkg_resources
 import pickle
+import re
 import string
 
 import openpyxl
 import openpyxl.styles
+from openpyxl.formatting.rule import ColorScaleRule
 from openpyxl.styles import Alignment
-from openpyxl.worksheet.table import Table
-import netaddr
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.table import Table, TableStyleInfo
 from tqdm import tqdm
 
 from navv import data_types
-from navv.utilities import timeit
+from navv.bll import MAX_EDGE_PORTS, get_mac_vendor_index, get_segment_matrix_df
+from navv.flow_stats import FLOW_METRICS, HOST_FLOW_METRICS
+from navv.inventory import InventoryIndex, normalize_mac
+from navv.networks import PRIVATE_NETWORKS, get_local_networks, is_multicast
+from navv.spill import SpillingCounter
+from navv.utilities import get_mac_vendor, timeit
+from navv.validators import is_mac_address
 from navv.message_handler import warning_msg
 
 
@@ -42,33 +51,99 @@ HEADER_STYLE = openpyxl.styles.NamedStyle(
     font=openpyxl.styles.Font(name="Calibri", size=11, bold=True),
     fill=openpyxl.styles.PatternFill("solid", fgColor="4286F4"),
 )
-IPV6_CELL_COLOR = (
-    openpyxl.styles.PatternFill("solid", fgColor="FFFFFF"),
-    openpyxl.styles.Font(name="Calibri", size=11, color="ff0000"),
-)
-EXTERNAL_NETWORK_CELL_COLOR = (
-    openpyxl.styles.PatternFill("solid", fgColor="030303"),
-    openpyxl.styles.Font(name="Calibri", size=11, color="ffff00"),
-)
-INTERNAL_NETWORK_CELL_COLOR = (
-    openpyxl.styles.PatternFill("solid", fgColor="ffff00"),
-    openpyxl.styles.Font(name="Calibri", size=11, color="000000"),
-)
-ICMP_CELL_COLOR = (
-    openpyxl.styles.PatternFill("solid", fgColor="ff33cc"),
-    openpyxl.styles.Font(name="Calibri", size=11, color="000000"),
-)
-UNKNOWN_EXTERNAL_CELL_COLOR = (
-    openpyxl.styles.PatternFill("solid", fgColor="ffffff"),
-    openpyxl.styles.Font(name="Calibri", size=11, color="000000"),
-)
-ALREADY_UNRESOLVED = list()
+
+
+class CellStyles:
+    """Registry of the (fill, font) cell styles of a workbook, referenced by small integer ids.
+
+    Analysis rows and the reference data carry these ids instead of the style
+    objects; the sheet writer resolves them when the cells are written. Every
+    registry starts with BUILTIN_CELL_STYLES, so their ids are the constants
+    below. Worker processes only ever see the ids.
+    """
+
+    def __init__(self):
+        self.styles = []
+        self.ids = dict()
+        for fill, font in BUILTIN_CELL_STYLES:
+            self.add(fill, font)
+
+    def __copy__(self):
+        cell_styles = CellStyles.__new__(CellStyles)
+        cell_styles.styles = list(self.styles)
+        cell_styles.ids = dict(self.ids)
+        return cell_styles
+
+    def add(self, fill, font):
+        """Return the id of the style, registering it if it is new"""
+        key = (fill, font)
+        if key not in self.ids:
+            self.ids[key] = len(self.styles)
+            self.styles.append(key)
+        return self.ids[key]
+
+    def __getitem__(self, style_id):
+        return self.styles[style_id]
+
+
+# (fill, font) of the styles every CellStyles starts with, in the order of their ids
+BUILTIN_CELL_STYLES = [
+    (
+        openpyxl.styles.PatternFill("solid", fgColor="FFFFFF"),
+        openpyxl.styles.Font(name="Calibri", size=11, color="ff0000"),
+    ),
+    (
+        openpyxl.styles.PatternFill("solid", fgColor="030303"),
+        openpyxl.styles.Font(name="Calibri", size=11, color="ffff00"),
+    ),
+    (
+        openpyxl.styles.PatternFill("solid", fgColor="ffff00"),
+        openpyxl.styles.Font(name="Calibri", size=11, color="000000"),
+    ),
+    (
+        openpyxl.styles.PatternFill("solid", fgColor="ff33cc"),
+        openpyxl.styles.Font(name="Calibri", size=11, color="000000"),
+    ),
+    (
+        openpyxl.styles.PatternFill("solid", fgColor="ffffff"),
+        openpyxl.styles.Font(name="Calibri", size=11, color="000000"),
+    ),
+]
+(
+    IPV6_CELL_COLOR,
+    EXTERNAL_NETWORK_CELL_COLOR,
+    INTERNAL_NETWORK_CELL_COLOR,
+    ICMP_CELL_COLOR,
+    UNKNOWN_EXTERNAL_CELL_COLOR,
+) = range(len(BUILTIN_CELL_STYLES))
+INPUT_SHEET_NAMES = ["Inventory Input", "Segments"]
+# Excel sheets hold at most 1,048,576 rows, one of which is the header
+MAX_ANALYSIS_ROWS = 1048575
+INVALID_SHEET_NAME_CHARS = re.compile(r"[\[\]:*?/\\]")
+ANALYSIS_INDEX_SHEET = "Analysis Index"
+ENRICH_BATCH_SIZE = 10000
+# Batches queued or being enriched per worker process, bounds the rows in flight
+ENRICH_BATCHES_PER_WORKER = 2
+MAX_MATRIX_SEGMENTS = 100
+# Reference data of the enrichment worker processes, set by _init_enrich_worker
+_ENRICH_CONTEXT = None
 
 
 def get_workbook(file_name):
-    """Create the blank Inventory and Segment sheets for data input into the tool"""
+    """Create the blank Inventory and Segment sheets for data input into the tool
+
+    If the workbook already exists, only its input sheets are read (in read-only
+    mode) and copied into a fresh workbook, so previous output is never parsed.
+    """
     if os.path.isfile(file_name):
-        wb = openpyxl.load_workbook(file_name)
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        input_wb = openpyxl.load_workbook(file_name, read_only=True)
+        try:
+            for sheet_name in INPUT_SHEET_NAMES:
+                copy_sheet(input_wb[sheet_name], wb.create_sheet(sheet_name))
+        finally:
+            input_wb.close()
     else:
         wb = openpyxl.Workbook()
         inv_sheet = wb.active
@@ -84,76 +159,168 @@ def get_workbook(file_name):
     return wb
 
 
+def copy_sheet(source, target):
+    """Copy the values and styles of the cells of a read-only sheet into target"""
+    for row in source.iter_rows():
+        for cell in row:
+            if cell.value is None and not cell.has_style:
+                continue
+            new_cell = target.cell(row=cell.row, column=cell.column, value=cell.value)
+            if cell.has_style:
+                new_cell.font = copy(cell.font)
+                new_cell.fill = copy(cell.fill)
+                new_cell.border = copy(cell.border)
+                new_cell.alignment = copy(cell.alignment)
+                new_cell.number_format = cell.number_format
+
+
 @timeit
-def get_inventory_data(ws, **kwargs):
-    inventory = dict()
+def get_inventory_data(ws, cell_styles, **kwargs):
+    """Return an InventoryIndex of the Inventory Input sheet.
+
+    The first column holds an IP address, a CIDR or a MAC address, the second
+    the name of the device or network. The colors of the entries are
+    registered in the workbook's cell_styles.
+    """
+    inventory = InventoryIndex()
+    # rows mostly share a handful of cell styles, only copy each one once
+    colors = dict()
+    mac_vendor_index = None
     for row in itertools.islice(ws.iter_rows(), 1, None):
         if not row[0].value or not row[1].value:
             continue
-        inventory[row[0].value] = data_types.InventoryItem(
-            ip=row[0].value,
+        key = str(row[0].value).strip()
+        if row[0].style_id not in colors:
+            colors[row[0].style_id] = cell_styles.add(
+                copy(row[0].fill), copy(row[0].font)
+            )
+        item = data_types.InventoryItem(
+            ip=key,
             name=row[1].value,
-            color=(copy(row[0].fill), copy(row[0].font)),
+            color=colors[row[0].style_id],
             mac_address="",
-            vendor=""
+            vendor="",
         )
+        if is_mac_address(key):
+            if mac_vendor_index is None:
+                mac_vendor_index = get_mac_vendor_index()
+            item.ip = ""
+            item.mac_address = normalize_mac(key)
+            item.vendor = get_mac_vendor(mac_vendor_index, item.mac_address)
+        try:
+            inventory.add(key, item)
+        except ValueError:
+            warning_msg(f"Skipping inventory entry {key}: not an IP, CIDR or MAC")
     return inventory
 
 
 @timeit
-def get_segments_data(ws):
+def get_segments_data(ws, cell_styles=None):
+    """Return a Segment for each CIDR of the Segments sheet
+
+    The colors of the segments are registered in cell_styles, the workbook's
+    CellStyles, when the segments are used to write the Analysis sheets.
+    """
+    if cell_styles is None:
+        cell_styles = CellStyles()
     segments = []
-    network_ip = ""
     for row in itertools.islice(ws.iter_rows(), 1, None):
         if not row[2].value:
             continue
-        network_ip = row[2].value
-        network_ips = [str(ip) for ip in netaddr.IPNetwork(network_ip)]
-        for ip in network_ips:
-            segments.append(
-                data_types.Segment(
-                    name=row[0].value,
-                    description=row[1].value,
-                    network=ip,
-                    color=[copy(row[0].fill), copy(row[0].font)],
-                )
+        segments.append(
+            data_types.Segment(
+                name=row[0].value,
+                description=row[1].value,
+                network=str(row[2].value).strip(),
+                color=cell_styles.add(copy(row[0].fill), copy(row[0].font)),
             )
+        )
     return segments
 
 
 def get_package_data():
-    """Load services and conn_states data into memory"""
+    """Return the services and conn_states data and a new CellStyles for a workbook
+
+    services is returned as a flat { (proto, port): (name, style id) } index,
+    see get_service_index. The package data is only loaded once per process;
+    every call returns its own copy of the CellStyles holding its styles, so
+    the styles of one workbook never leak into another.
+    """
+    services, conn_states, cell_styles = load_package_data()
+    return services, conn_states, copy(cell_styles)
+
+
+@lru_cache(maxsize=None)
+def load_package_data():
+    """Load services and conn_states data into memory, once per process"""
     with open(DATA_PKL_FILE, "rb") as f:
         services, conn_states = pickle.load(f)
-    return services, conn_states
+    cell_styles = CellStyles()
+    return get_service_index(services, cell_styles), conn_states, cell_styles
+
+
+def get_service_index(services, cell_styles):
+    """Flatten { port: { proto: (name, (fill, font)) } } into { (proto, port): (name, style id) }
+
+    The ICMP type tables are folded in under the ICMPv4 and ICMPv6 protos. The
+    pickle also has a few integer keyed icmp entries that the string ports in
+    conn.log never matched; they are left out so ICMP keeps using the type
+    tables.
+    """
+    service_index = {
+        (proto, int(port)): (name, cell_styles.add(*style))
+        for port, protos in services.items()
+        if isinstance(port, str)
+        for proto, (name, style) in protos.items()
+    }
+    for proto, icmp_types in (
+        ("ICMPv4", data_types.icmp4_types),
+        ("ICMPv6", data_types.icmp6_types),
+    ):
+        for icmp_type, name in icmp_types.items():
+            service_index[(proto, int(icmp_type))] = (name, ICMP_CELL_COLOR)
+    return service_index
 
 
 @timeit
-def create_analysis_array(sort_input, **kwargs):
-    arr = []
+def create_analysis_array(sort_input, conn_counts=None, **kwargs):
+    """Count the conn.log rows into AnalysisRowItems, most frequent first
+
+    If the rows were already counted by get_conn_data, pass the Counter,
+    SpaceSaving sketch or SpillingCounter as conn_counts to use its counts
+    instead of counting sort_input. The rows of a SpillingCounter are
+    returned as a generator rather than a list.
+    """
+    if isinstance(conn_counts, SpillingCounter):
+        # sorted on disk, the rows are only created as they are written
+        return (
+            to_analysis_row(item, count)
+            for item, count in conn_counts.most_common_items()
+        )
+    if conn_counts is None:
+        conn_counts = Counter(sort_input)
     # sort by count and source IP
     counted = sorted(
-        list(
-            str(count) + "\t" + item
-            for item, count in sorted(Counter(sort_input).items(), key=lambda x: x[0])
-        ),
-        key=lambda x: int(x.split("\t")[0]),
+        sorted(conn_counts.items(), key=lambda x: x[0]),
+        key=lambda x: x[1],
         reverse=True,
     )
-    for row in counted:
-        cells = row.split("\t")
-        arr.append(
-            data_types.AnalysisRowItem(
-                count=cells[0],
-                src_ip=cells[1],
-                dest_ip=cells[2],
-                port=cells[3],
-                proto=cells[4],
-                conn=cells[5],
-            )
-        )
-
-    return arr
+    return [to_analysis_row(item, count) for item, count in counted]
+
+
+def to_analysis_row(item, count):
+    """Return the AnalysisRowItem of a counted tab-separated conn.log row"""
+    cells = item.split("\t")
+    return data_types.AnalysisRowItem(
+        count=count,
+        src_ip=cells[0],
+        dest_ip=cells[1],
+        port=int(cells[2]),
+        proto=cells[3],
+        conn=cells[4],
+        src_mac=cells[5] if len(cells) > 5 else "",
+        dest_mac=cells[6] if len(cells) > 6 else "",
+    )
 
 
 @timeit
@@ -165,179 +332,407 @@ def perform_analysis(
     inventory,
     segments,
     dns_data,
-    json_path,
     ext_IPs,
     unk_int_IPs,
+    cell_styles,
+    max_rows=MAX_ANALYSIS_ROWS,
+    split_by_segment=False,
+    workers=1,
+    local_nets=(),
     **kwargs,
 ):
-    sheet = make_sheet(wb, "Analysis", idx=0)
-    sheet.append(
-        [
-            "Count",
-            "Src_IP",
-            "Src_Desc",
-            "Dest_IP",
-            "Dest_Desc",
-            "Port",
-            "Service",
-            "Proto",
-            "Conn_State",
-            "Notes",
-        ]
-    )
+    analysis_sheets = AnalysisSheets(wb, max_rows)
+    local_networks = get_local_networks(segments, local_nets)
+    # conn_state -> style id
+    conn_state_styles = {
+        conn_state: cell_styles.add(fill, font)
+        for conn_state, (fill, font, _) in conn_states.items()
+    }
     warning_msg("this may take awhile...")
-    for row_index, row in enumerate(tqdm(rows), start=2):
-        row.src_desc = handle_ip(
-            row.src_ip, dns_data, inventory, segments, ext_IPs, unk_int_IPs
+    enriched_rows = enrich_rows(
+        rows,
+        services,
+        conn_state_styles,
+        inventory,
+        local_networks,
+        dns_data,
+        ext_IPs,
+        unk_int_IPs,
+        workers,
+    )
+    total = len(rows) if isinstance(rows, list) else None
+    for row in tqdm(enriched_rows, total=total):
+        segment = local_networks.lookup(row.src_ip) if split_by_segment else None
+        partition, row_index = analysis_sheets.next_row(
+            segment.name if isinstance(segment, data_types.Segment) else None
         )
-        row.dest_desc = handle_ip(
-            row.dest_ip, dns_data, inventory, segments, ext_IPs, unk_int_IPs
+        write_row_to_sheet(
+            row, row_index, partition.sheet, partition.widths, cell_styles
         )
-        handle_service(row, services)
-        row.conn = (row.conn, conn_states[row.conn])
-        write_row_to_sheet(row, row_index, sheet)
-    tab = Table(displayName="AnalysisTable", ref=f"A1:J{len(rows)+1}")
-    sheet.add_table(tab)
-    # write lookup data to json file for future use
-    with open(json_path, "w+") as fp:
-        json.dump(dns_data, fp)
+    analysis_sheets.close()
 
 
-def write_row_to_sheet(row, row_index, sheet):
-    sheet.cell(row=row_index, column=1, value=int(row.count))
+def enrich_row(
+    row, services, conn_states, inventory, local_networks, dns_data, ext_IPs, unk_int_IPs
+):
+    """Fill in the descriptions, service and styles of an analysis row
+
+    conn_states maps each conn_state to its style id.
+    """
+    row.src_desc, row.src_style = handle_ip(
+        row.src_ip,
+        dns_data,
+        inventory,
+        local_networks,
+        ext_IPs,
+        unk_int_IPs,
+        mac=row.src_mac,
+    )
+    row.dest_desc, row.dest_style = handle_ip(
+        row.dest_ip,
+        dns_data,
+        inventory,
+        local_networks,
+        ext_IPs,
+        unk_int_IPs,
+        mac=row.dest_mac,
+    )
+    handle_service(row, services)
+    row.conn_style = conn_states[row.conn]
+    return row
+
+
+def enrich_rows(
+    rows,
+    services,
+    conn_states,
+    inventory,
+    local_networks,
+    dns_data,
+    ext_IPs,
+    unk_int_IPs,
+    workers=1,
+):
+    """Yield the enriched rows in order, spreading batches of rows over worker processes.
+
+    The workers receive the reference data once, when they start, and a plain
+    snapshot of the DNS store for the addresses in the rows. Reverse DNS
+    results and the external and unknown internal IPs found by the workers are
+    merged back as their batches come in. At most ENRICH_BATCHES_PER_WORKER
+    batches per worker are in flight at once, so the pickled copies of the
+    rows do not pile up in the pool's queue.
+    """
+    # rows streamed from disk are enriched in this process
+    if (
+        workers <= 1
+        or not isinstance(rows, list)
+        or len(rows) <= ENRICH_BATCH_SIZE
+    ):
+        for row in rows:
+            yield enrich_row(
+                row,
+                services,
+                conn_states,
+                inventory,
+                local_networks,
+                dns_data,
+                ext_IPs,
+                unk_int_IPs,
+            )
+        return
 
+    dns_snapshot = dns_data.snapshot(
+        {ip for row in rows for ip in (row.src_ip, row.dest_ip)}
+    )
+    batches = (
+        rows[start : start + ENRICH_BATCH_SIZE]
+        for start in range(0, len(rows), ENRICH_BATCH_SIZE)
+    )
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_enrich_worker,
+        initargs=(services, conn_states, inventory, local_networks, dns_snapshot),
+    ) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(_enrich_batch, batch))
+            if len(pending) >= workers * ENRICH_BATCHES_PER_WORKER:
+                yield from _merge_enriched_batch(
+                    pending.popleft().result(), dns_data, ext_IPs, unk_int_IPs
+                )
+        while pending:
+            yield from _merge_enriched_batch(
+                pending.popleft().result(), dns_data, ext_IPs, unk_int_IPs
+            )
+
+
+def _merge_enriched_batch(result, dns_data, ext_IPs, unk_int_IPs):
+    """Merge what a worker found while enriching a batch, return the enriched rows"""
+    batch, batch_ext_IPs, batch_unk_int_IPs, reverse = result
+    ext_IPs.update(batch_ext_IPs)
+    unk_int_IPs.update(batch_unk_int_IPs)
+    dns_data.merge_reverse(reverse)
+    return batch
+
+
+def _init_enrich_worker(*context):
+    global _ENRICH_CONTEXT
+    _ENRICH_CONTEXT = context
+
+
+def _enrich_batch(batch):
+    services, conn_states, inventory, local_networks, dns_data = _ENRICH_CONTEXT
+    ext_IPs = set()
+    unk_int_IPs = set()
+    for row in batch:
+        enrich_row(
+            row,
+            services,
+            conn_states,
+            inventory,
+            local_networks,
+            dns_data,
+            ext_IPs,
+            unk_int_IPs,
+        )
+    return batch, ext_IPs, unk_int_IPs, dns_data.pop_new_reverse()
+
+
+class AnalysisSheets:
+    """Spread the Analysis rows over as many sheets as needed, in a single pass.
+
+    Rows are grouped by an optional key (the source segment) and each group
+    rolls over to a new sheet once it holds max_rows rows. Rows without a key
+    go to the "Analysis" sheet, the other sheets are placed at the end of the
+    workbook grouped by key. Every sheet gets its own table, and an
+    "Analysis Index" sheet links them when there is more than one.
+    """
+
+    def __init__(self, wb, max_rows=MAX_ANALYSIS_ROWS):
+        self.wb = wb
+        self.max_rows = max_rows
+        self.partitions = []
+        self.current = dict()
+        self.key_order = dict()
+        self._add_partition(None)
+
+    def next_row(self, key=None):
+        """Return the partition and row index the next row for key is written to"""
+        partition = self.current.get(key)
+        if partition is None or partition.rows >= self.max_rows:
+            partition = self._add_partition(key)
+        partition.rows += 1
+        return partition, partition.rows + 1
+
+    def _add_partition(self, key):
+        base_name = "Analysis" if key is None else f"Analysis {key}"
+        base_name = INVALID_SHEET_NAME_CHARS.sub("_", base_name)[:25]
+        name = base_name
+        # the index sheet is only added in close(), keep its name free
+        used_names = {partition.name.lower() for partition in self.partitions}
+        used_names.add(ANALYSIS_INDEX_SHEET.lower())
+        suffix = 2
+        while name.lower() in used_names:
+            name = f"{base_name} {suffix}"
+            suffix += 1
+
+        sheet = make_sheet(self.wb, name, idx=None if self.partitions else 0)
+        widths = ColumnWidths()
+        sheet.append(COL_NAMES)
+        widths.update(COL_NAMES)
+        partition = data_types.AnalysisPartition(
+            name=name,
+            key=key,
+            table_name="AnalysisTable"
+            + (str(len(self.partitions) + 1) if self.partitions else ""),
+            sheet=sheet,
+            widths=widths,
+        )
+        self.partitions.append(partition)
+        self.current[key] = partition
+        self.key_order.setdefault(key, len(self.key_order))
+        return partition
+
+    def close(self):
+        """Add the tables, fit the column widths and write the index sheet"""
+        self.partitions.sort(key=lambda partition: self.key_order[partition.key])
+        for partition in self.partitions[1:]:
+            self.wb.move_sheet(
+                partition.sheet,
+                offset=len(self.wb.sheetnames) - 1 - self.wb.index(partition.sheet),
+            )
+
+        for partition in self.partitions:
+            tab = Table(displayName=partition.table_name, ref=f"A1:J{partition.rows+1}")
+            partition.sheet.add_table(tab)
+            partition.widths.apply(partition.sheet)
+
+        if len(self.partitions) > 1:
+            index_sheet = make_sheet(self.wb, ANALYSIS_INDEX_SHEET, idx=0)
+            widths = ColumnWidths()
+            header = ["Sheet", "Source Segment", "Rows"]
+            index_sheet.append(header)
+            widths.update(header)
+            for row_index, partition in enumerate(self.partitions, start=2):
+                values = [partition.name, partition.key or "", partition.rows]
+                index_sheet.append(values)
+                widths.update(values)
+                cell = index_sheet.cell(row=row_index, column=1)
+                cell.hyperlink = f"#'{partition.name}'!A1"
+                cell.style = "Hyperlink"
+            widths.apply(index_sheet)
+
+
+def write_row_to_sheet(row, row_index, sheet, widths, cell_styles):
+    widths.update(
+        [
+            row.count,
+            row.src_ip,
+            row.src_desc,
+            row.dest_ip,
+            row.dest_desc,
+            row.port,
+            row.service,
+            row.proto,
+            row.conn,
+        ]
+    )
+    sheet.cell(row=row_index, column=1, value=row.count)
+
+    src_fill, src_font = cell_styles[row.src_style]
     src_IP = sheet.cell(row=row_index, column=2, value=row.src_ip)
-    src_IP.fill = row.src_desc[1][0]
-    src_IP.font = row.src_desc[1][1]
+    src_IP.fill = src_fill
+    src_IP.font = src_font
 
-    src_Desc = sheet.cell(row=row_index, column=3, value=row.src_desc[0])
-    src_Desc.fill = row.src_desc[1][0]
-    src_Desc.font = row.src_desc[1][1]
+    src_Desc = sheet.cell(row=row_index, column=3, value=row.src_desc)
+    src_Desc.fill = src_fill
+    src_Desc.font = src_font
 
+    dest_fill, dest_font = cell_styles[row.dest_style]
     dest_IP = sheet.cell(row=row_index, column=4, value=row.dest_ip)
-    dest_IP.fill = row.dest_desc[1][0]
-    dest_IP.font = row.dest_desc[1][1]
+    dest_IP.fill = dest_fill
+    dest_IP.font = dest_font
 
-    dest_Desc = sheet.cell(row=row_index, column=5, value=row.dest_desc[0])
-    dest_Desc.fill = row.dest_desc[1][0]
-    dest_Desc.font = row.dest_desc[1][1]
+    dest_Desc = sheet.cell(row=row_index, column=5, value=row.dest_desc)
+    dest_Desc.fill = dest_fill
+    dest_Desc.font = dest_font
 
-    sheet.cell(row=row_index, column=6, value=int(row.port))
+    sheet.cell(row=row_index, column=6, value=row.port)
 
-    service = sheet.cell(row=row_index, column=7, value=row.service[0])
-    service.fill = row.service[1][0]
-    service.font = row.service[1][1]
+    service = sheet.cell(row=row_index, column=7, value=row.service)
+    service.fill, service.font = cell_styles[row.service_style]
 
     sheet.cell(row=row_index, column=8, value=row.proto)
 
-    conn_State = sheet.cell(row=row_index, column=9, value=row.conn[0])
-    conn_State.fill = row.conn[1][0]
-    conn_State.font = row.conn[1][1]
+    conn_State = sheet.cell(row=row_index, column=9, value=row.conn)
+    conn_State.fill, conn_State.font = cell_styles[row.conn_style]
 
     # placeholder for notes cell
     sheet.cell(row=row_index, column=10, value="")
 
 
 def handle_service(row, services):
-    # { port: { proto: (name, (fill, font)} }
-    if row.port in services and row.proto in services[row.port]:
-        row.service = services[row.port][row.proto]
+    # { (proto, port): (name, style id) }
+    if row.proto == "icmp":
+        row.proto = "ICMPv6" if ":" in row.src_ip else "ICMPv4"
+        default = ("unknown icmp", ICMP_CELL_COLOR)
     else:
-        if row.proto == "icmp":
-            if netaddr.valid_ipv4(row.src_ip):
-                row.proto = "ICMPv4"
-                service_dict = data_types.icmp4_types
-            else:
-                row.proto = "ICMPv6"
-                service_dict = data_types.icmp6_types
-            if row.port in service_dict:
-                row.service = (service_dict[row.port], ICMP_CELL_COLOR)
-            else:
-                row.service = ("unknown icmp", ICMP_CELL_COLOR)
-        else:
-            row.service = ("unknown service", UNKNOWN_EXTERNAL_CELL_COLOR)
+        default = ("unknown service", UNKNOWN_EXTERNAL_CELL_COLOR)
+    row.service, row.service_style = services.get((row.proto, row.port), default)
 
 
-def handle_ip(ip_to_check, dns_data, inventory, segments, ext_IPs, unk_int_IPs):
+def handle_ip(
+    ip_to_check, dns_data, inventory, local_networks, ext_IPs, unk_int_IPs, mac=None
+):
     """Function take IP Address and uses collected dns_data, inventory, and segment information to give IP Addresses in analysis context.
 
     Priority flow:
         * DHCP Broadcasting
         * Multicast
-        * Within Segments identified
+        * Within Segments identified (the most specific segment)
             * Resolution by DNS, then Inventory, and then Unknown
             * Appends name if External IP
-        * Private Network
+        * Local Network (private address space and the extra local nets)
             * Resolution by DNS, Inventory, then Unknown
+        * Other IPv6
         * External (Public IP space) or Internet
-            * Resolution by DNS, Unknown
+            * Resolution by DNS, Inventory, then reverse DNS
+
+    Segments and local networks are found with a single lookup in the
+    local_networks PrefixIndex, and no DNS queries are made for them. The
+    inventory is an InventoryIndex, matched by exact IP, then by the MAC
+    address seen with the IP, then by the most specific inventoried network.
 
     This will capture the name description and the color coding identified within the worksheet.
     """
-    segment_ips = [segment.network for segment in segments]
-    desc_to_change = ("Not Triggered IP", IPV6_CELL_COLOR)
-    if ip_to_check == str("0.0.0.0"):
+    is_ipv6 = ":" in ip_to_check
+    if ip_to_check == "0.0.0.0":
         desc_to_change = (
             "Unassigned IPv4",
             IPV6_CELL_COLOR,
         )
-    elif ip_to_check == str("255.255.255.255"):
+    elif ip_to_check == "255.255.255.255":
         desc_to_change = (
             "IPv4 All Subnet Broadcast",
             IPV6_CELL_COLOR,
         )
-    elif (
-        netaddr.valid_ipv6(ip_to_check) or netaddr.IPAddress(ip_to_check).is_multicast()
-    ):
+    elif is_multicast(ip_to_check, is_ipv6):
         desc_to_change = (
-            f"{'IPV6' if netaddr.valid_ipv6(ip_to_check) else 'IPV4'}{'_Multicast' if netaddr.IPAddress(ip_to_check).is_multicast() else ''}",
+            f"{'IPV6' if is_ipv6 else 'IPV4'}_Multicast",
             IPV6_CELL_COLOR,
         )
-    elif ip_to_check in segment_ips:
-        for x in range(0, len(segments[:-1])):
-            if segments[x].network == ip_to_check:
-                if ip_to_check in dns_data:
-                    resolution = dns_data[ip_to_check]
-                elif ip_to_check in inventory:
-                    resolution = inventory[ip_to_check].name
-                else:
-                    resolution = f"Unknown device in {segments[x].name} network"
-                    unk_int_IPs.add(ip_to_check)
-                if not netaddr.IPAddress(ip_to_check).is_ipv4_private_use():
-                    resolution = resolution + " {Non-Priv IP}"
-                desc_to_change = (
-                    resolution,
-                    segments[x].color,
-                    )
-    elif netaddr.IPAddress(ip_to_check).is_ipv4_private_use():
-        if ip_to_check in dns_data:
-            desc_to_change = (dns_data[ip_to_check], INTERNAL_NETWORK_CELL_COLOR)
-        elif ip_to_check in inventory:
-            desc_to_change = (inventory[ip_to_check].name, INTERNAL_NETWORK_CELL_COLOR)
-        else:
-            desc_to_change = ("Unknown Internal address", INTERNAL_NETWORK_CELL_COLOR)
-            unk_int_IPs.add(ip_to_check)
     else:
-        ext_IPs.add(ip_to_check)
-        if ip_to_check in dns_data:
-            resolution = dns_data[ip_to_check]
-        elif ip_to_check in inventory:
-            resolution = inventory[ip_to_check].name + " {Non-Priv IP}"
+        network = local_networks.lookup(ip_to_check, default=False)
+        inventory_item = inventory.lookup(ip_to_check, mac)
+        if isinstance(network, data_types.Segment):
+            if ip_to_check in dns_data:
+                resolution = dns_data[ip_to_check]
+            elif inventory_item is not None:
+                resolution = inventory_item.name
+            else:
+                resolution = f"Unknown device in {network.name} network"
+                unk_int_IPs.add(ip_to_check)
+            if ip_to_check not in PRIVATE_NETWORKS:
+                resolution = resolution + " {Non-Priv IP}"
+            desc_to_change = (resolution, network.color)
+        elif network:
+            if ip_to_check in dns_data:
+                desc_to_change = (dns_data[ip_to_check], INTERNAL_NETWORK_CELL_COLOR)
+            elif inventory_item is not None:
+                desc_to_change = (
+                    inventory_item.name,
+                    INTERNAL_NETWORK_CELL_COLOR,
+                )
+            else:
+                desc_to_change = (
+                    "Unknown Internal address",
+                    INTERNAL_NETWORK_CELL_COLOR,
+                )
+                unk_int_IPs.add(ip_to_check)
+        elif is_ipv6:
+            desc_to_change = ("IPV6", IPV6_CELL_COLOR)
         else:
-            try:
-                resolution = socket.gethostbyaddr(ip_to_check)[0]
-            except socket.herror:
-                ALREADY_UNRESOLVED.append(ip_to_check)
-            finally:
-                resolution = "Unresolved external address"
-        desc_to_change = (resolution, EXTERNAL_NETWORK_CELL_COLOR)
+            ext_IPs.add(ip_to_check)
+            if ip_to_check in dns_data:
+                resolution = dns_data[ip_to_check]
+            elif inventory_item is not None:
+                resolution = inventory_item.name + " {Non-Priv IP}"
+            else:
+                resolution = (
+                    dns_data.reverse_lookup(ip_to_check)
+                    or "Unresolved external address"
+                )
+            desc_to_change = (resolution, EXTERNAL_NETWORK_CELL_COLOR)
     return desc_to_change
 
 
 def write_conn_states_sheet(conn_states, wb):
     new_ws = make_sheet(wb, "Conn States", idx=8)
+    widths = ColumnWidths()
     new_ws.append(["State", "Description"])
+    widths.update(["State", "Description"])
     for index, conn_state in enumerate(conn_states, start=2):
+        widths.update([conn_state, conn_states[conn_state][2]])
         # State column
         state_cell = new_ws[f"A{index}"]
         state_cell.value = conn_state
@@ -350,13 +745,24 @@ def write_conn_states_sheet(conn_states, wb):
         desc_cell.value = conn_states[conn_state][2]
         desc_cell.fill = conn_states[conn_state][0]
         desc_cell.font = conn_states[conn_state][1]
-    auto_adjust_width(new_ws, 100)
+    widths.apply(new_ws, 100)
 
 
 def write_inventory_report_sheet(inventory_df, wb):
     """Get Mac Addresses with their associated IP addresses and manufacturer."""
     ir_sheet = make_sheet(wb, "Inventory Report", idx=4)
-    ir_sheet.append(["MAC", "Vendor", "Hostname", "IPv4", "IPv6", "Port and Proto"])
+    widths = ColumnWidths()
+    header = [
+        "MAC",
+        "Vendor",
+        "Hostname",
+        "IPv4",
+        "IPv6",
+        "Port and Proto",
+        "Inventory Name",
+    ]
+    ir_sheet.append(header)
+    widths.update(header)
 
     inventory_data = inventory_df.to_dict(orient="records")
     for index, row in enumerate(inventory_data, start=2):
@@ -400,92 +806,394 @@ def write_inventory_report_sheet(inventory_df, wb):
         port_and_proto = ""
         if row["port_and_proto"]:
             port_and_proto = ", ".join(
-                list(set(each for each in row["port_and_proto"] if each))[:10]
+                [each for each in row["port_and_proto"] if each][:10]
             )
 
         pnp_column.value = port_and_proto
 
+        # Inventory Name column
+        ir_sheet[f"G{index}"].value = row.get("inventory_name", "")
+
+        widths.update(
+            [
+                row["mac"],
+                row["vendor"],
+                hostname,
+                ipv4,
+                ipv6,
+                port_and_proto,
+                row.get("inventory_name", ""),
+            ]
+        )
+
         # Add styling to every other row
         if index % 2 == 0:
             for cell in ir_sheet[f"{index}:{index}"]:
                 cell.fill = openpyxl.styles.PatternFill("solid", fgColor="AAAAAA")
-    auto_adjust_width(ir_sheet, 40)
+    widths.apply(ir_sheet, 40)
 
 
 def write_snmp_sheet(snmp_df, wb):
-    """Write SNMP log data to excel sheet."""
+    """Write the aggregated SNMP requests to excel sheet, one appended row each."""
     sheet = make_sheet(wb, "SNMP", idx=4)
-    sheet.append(
-        ["Src IPv4", "Src Port", "Dest IPv4", "Dest Port", "Version", "Community"]
-    )
-
-    for index, row in enumerate(snmp_df.to_dict(orient="records"), start=2):
-        # Source IPv4 column
-        sheet[f"A{index}"].value = row["src_ip"]
-
-        # Source Port column
-        sheet[f"B{index}"].value = row["src_port"]
-
-        # Destination IPv4 column
-        sheet[f"C{index}"].value = row["dst_ip"]
-
-        # Destination Port column
-        sheet[f"D{index}"].value = row["dst_port"]
-
-        # Version column
-        sheet[f"E{index}"].value = row["version"]
-
-        # Community column
-        sheet[f"F{index}"].value = row["community"]
+    widths = ColumnWidths()
+    header = [
+        "Src IP",
+        "Dest IP",
+        "Dest Port",
+        "Version",
+        "Community",
+        "Count",
+        "First Seen (UTC)",
+        "Last Seen (UTC)",
+    ]
+    sheet.append(header)
+    widths.update(header)
+
+    for row in snmp_df.itertuples(index=False):
+        values = [
+            row.src_ip,
+            row.dst_ip,
+            row.dst_port,
+            row.version,
+            row.community,
+            row.count,
+            format_timestamp(row.first_seen),
+            format_timestamp(row.last_seen),
+        ]
+        sheet.append(values)
+        widths.update(values)
+
+    # banded by the table style rather than by filling every other row
+    if len(snmp_df):
+        sheet.add_table(
+            Table(
+                displayName="SNMP",
+                ref=f"A1:H{len(snmp_df) + 1}",
+                tableStyleInfo=TableStyleInfo(
+                    name="TableStyleMedium9", showRowStripes=True
+                ),
+            )
+        )
+    widths.apply(sheet, 40)
 
-        # Add styling to every other row
-        if index % 2 == 0:
-            for cell in sheet[f"{index}:{index}"]:
-                cell.fill = openpyxl.styles.PatternFill("solid", fgColor="AAAAAA")
 
-    auto_adjust_width(sheet, 40)
+def format_timestamp(ts):
+    """Return the epoch timestamp as a UTC date and time"""
+    if not ts or ts != ts:
+        return ""
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
 
 
-def write_externals_sheet(IPs, wb):
+def write_externals_sheet(IPs, wb, asn_index=None):
+    """List the external IPs, with their ASN and organization if an AsnIndex is given"""
     ext_sheet = make_sheet(wb, "Externals", idx=5)
-    ext_sheet.append(["External IP"])
+    widths = ColumnWidths()
+    header = ["External IP"]
+    asns = dict()
+    if asn_index is not None:
+        header += ["ASN", "Organization"]
+        # all the IPs are annotated at once, see AsnIndex.lookup_many
+        asns = asn_index.lookup_many(IPs)
+    ext_sheet.append(header)
+    widths.update(header)
     for row_index, IP in enumerate(sorted(IPs), start=2):
-        cell = ext_sheet[f"A{row_index}"]
-        cell.value = IP
-        if row_index % 2 == 0:
-            cell.fill = openpyxl.styles.PatternFill("solid", fgColor="AAAAAA")
-    auto_adjust_width(ext_sheet)
+        values = [IP]
+        if asn_index is not None:
+            values += list(asns.get(IP, ("", "")))
+        for column, value in enumerate(values, start=1):
+            cell = ext_sheet.cell(row=row_index, column=column, value=value)
+            if row_index % 2 == 0:
+                cell.fill = openpyxl.styles.PatternFill("solid", fgColor="AAAAAA")
+        widths.update(values)
+    widths.apply(ext_sheet)
 
 
 def write_unknown_internals_sheet(IPs, wb):
     int_sheet = make_sheet(wb, "Unknown Internals", idx=6)
+    widths = ColumnWidths()
     int_sheet.append(["Unknown Internal IP"])
+    widths.update(["Unknown Internal IP"])
     for row_index, IP in enumerate(sorted(IPs), start=2):
         cell = int_sheet[f"A{row_index}"]
         cell.value = IP
+        widths.update([IP])
         if row_index % 2 == 0:
             cell.fill = openpyxl.styles.PatternFill("solid", fgColor="AAAAAA")
-    auto_adjust_width(int_sheet)
+    widths.apply(int_sheet)
 
 
 def write_stats_sheet(wb, stats):
     stats_sheet = make_sheet(wb, "Stats", idx=7)
-    stats_sheet.append(
-        ["Length of Capture time"]
-        + [column for column in stats if column != "Length of Capture time"]
-    )
+    widths = ColumnWidths()
+    header = ["Length of Capture time"] + [
+        column for column in stats if column != "Length of Capture time"
+    ]
+    stats_sheet.append(header)
+    widths.update(header)
     stats_sheet["A2"] = stats.pop("Length of Capture time")
     for col_index, stat in enumerate(stats, 1):
         stats_sheet[f"{string.ascii_uppercase[col_index]}2"].value = stats[stat]
-    auto_adjust_width(stats_sheet)
+    widths.update([stats_sheet["A2"].value] + list(stats.values()))
+    widths.apply(stats_sheet)
+
+
+def get_approximation_stats(
+    conn_counts, ext_IPs, unk_int_IPs, distinct_hosts, internal_dns_names
+):
+    """Return the Stats sheet entries describing the error of the approximate counts
+
+    ext_IPs and unk_int_IPs only hold the hosts of the rows the sketch kept.
+    Unless the sketch kept every row, the distinct hosts are estimated from
+    every connection with the DistinctHosts counted while conn.log was read;
+    internal_dns_names are the internal IPs DNS has a name for.
+    """
+    rows = len(conn_counts.counters)
+    stats = {
+        "Analysis Counts": (
+            f"{rows} rows from {conn_counts.total} connections, "
+            f"counts overestimated by at most {conn_counts.max_error}"
+        )
+    }
+    # a key that replaces another inherits its weight as error
+    kept_every_row = conn_counts.max_error == 0
+    if kept_every_row:
+        # the hosts of the kept rows are all the hosts
+        estimates = [None, None]
+    else:
+        estimates = [
+            distinct_hosts.external_estimate(),
+            distinct_hosts.unknown_internal_estimate(internal_dns_names),
+        ]
+    for (name, IPs), estimate in zip(
+        (
+            ("Distinct External IPs", ext_IPs),
+            ("Distinct Unknown Internal IPs", unk_int_IPs),
+        ),
+        estimates,
+    ):
+        if estimate is None:
+            if IPs.is_exact:
+                stats[name] = str(len(IPs))
+                continue
+            estimate = len(IPs), round(2 * IPs.cardinality.relative_error * len(IPs))
+        count, error = estimate
+        stats[name] = (
+            f"~{max(count, len(IPs.sample))} (+/-{error}), {len(IPs.sample)} listed"
+        )
+    if not kept_every_row:
+        stats["Inventory Report and MAC"] = (
+            f"built from the {rows} kept Analysis rows only, "
+            "hosts seen only in the other connections are missing"
+        )
+    return stats
+
+
+def append_sheet_section(sheet, widths, title, header, rows):
+    """Append a titled table of rows below the sections already on the sheet"""
+    if sheet.max_row > 1:
+        sheet.append([])
+    sheet.append([title])
+    sheet.cell(row=sheet.max_row, column=1).font = HEADER_STYLE.font
+    sheet.append(header)
+    for cell in sheet[sheet.max_row]:
+        cell.style = HEADER_STYLE
+    widths.update(header)
+    for row_index, row in enumerate(rows):
+        sheet.append(row)
+        widths.update(row)
+        if row_index % 2:
+            for cell in sheet[sheet.max_row]:
+                cell.fill = openpyxl.styles.PatternFill("solid", fgColor="AAAAAA")
+
+
+def write_flow_stats_sheet(flow_stats, wb):
+    """Write the flow totals, top hosts and ports, segments and connection rates"""
+    sheet = make_sheet(wb, "Flow Stats", idx=8)
+    widths = ColumnWidths()
+
+    def append_section(title, header, rows):
+        append_sheet_section(sheet, widths, title, header, rows)
+
+    metrics = FLOW_METRICS
+    append_section(
+        "Totals", metrics, [[round(value, 3) for value in flow_stats.totals]]
+    )
+    append_section(
+        f"Top {flow_stats.hosts.k} Hosts by Bytes",
+        ["Host", "Bytes", "Error"] + HOST_FLOW_METRICS,
+        [
+            [host, weight, error] + [round(value, 3) for value in values]
+            for host, weight, error, values in flow_stats.hosts.top()
+        ],
+    )
+    append_section(
+        f"Top {flow_stats.ports.k} Ports by Bytes",
+        ["Proto", "Port", "Bytes", "Error"] + metrics,
+        [
+            [proto, port, weight, error] + [round(value, 3) for value in values]
+            for (proto, port), weight, error, values in flow_stats.ports.top()
+        ],
+    )
+    append_section(
+        "Source Segments",
+        ["Segment"] + metrics,
+        [
+            [segment] + [round(value, 3) for value in values]
+            for segment, values in sorted(
+                flow_stats.segments.items(), key=lambda item: item[1][0], reverse=True
+            )
+        ],
+    )
+    bucket_seconds = flow_stats.bucket_seconds
+    append_section(
+        f"Connections per {bucket_seconds} Seconds",
+        ["Start (UTC)", "Connections", "Bytes", "Connections/s", "Bytes/s"],
+        [
+            [
+                format_timestamp(start),
+                connections,
+                total_bytes,
+                round(connections / bucket_seconds, 3),
+                round(total_bytes / bucket_seconds, 3),
+            ]
+            for start, (connections, total_bytes) in sorted(flow_stats.buckets.items())
+        ],
+    )
+    widths.apply(sheet)
+
+
+def write_segment_matrix_sheet(edges_df, wb):
+    """Write the heat-mapped segment to segment connection matrix and the edge list
+
+    The matrix is left out when there are more than MAX_MATRIX_SEGMENTS
+    segments, the edge list only has the pairs that talked.
+    """
+    sheet = make_sheet(wb, "Segment Matrix", idx=9)
+    widths = ColumnWidths()
+    matrix_df = get_segment_matrix_df(edges_df)
+    if len(matrix_df) <= MAX_MATRIX_SEGMENTS:
+        sheet.append(["Connections (rows: source, columns: destination)"])
+        sheet.cell(row=1, column=1).font = HEADER_STYLE.font
+        header = ["Source Segment"] + list(matrix_df.columns)
+        sheet.append(header)
+        for cell in sheet[sheet.max_row]:
+            cell.style = HEADER_STYLE
+        widths.update(header)
+        for segment, counts in zip(matrix_df.index, matrix_df.itertuples(index=False)):
+            row = [segment] + [int(count) for count in counts]
+            sheet.append(row)
+            widths.update(row)
+        if len(matrix_df):
+            # one conditional format colors the whole matrix
+            sheet.conditional_formatting.add(
+                f"B3:{get_column_letter(len(matrix_df) + 1)}{len(matrix_df) + 2}",
+                ColorScaleRule(
+                    start_type="min",
+                    start_color="FFFFFF",
+                    mid_type="percentile",
+                    mid_value=50,
+                    mid_color="FFEB84",
+                    end_type="max",
+                    end_color="F8696B",
+                ),
+            )
+    else:
+        sheet.append(
+            [
+                f"{len(matrix_df)} segments, too many for a matrix "
+                f"(more than {MAX_MATRIX_SEGMENTS}), see the edge list"
+            ]
+        )
+    append_sheet_section(
+        sheet,
+        widths,
+        "Edges",
+        [
+            "Source Segment",
+            "Dest Segment",
+            "Connections",
+            "Bytes",
+            "Distinct Ports",
+            f"Ports (first {MAX_EDGE_PORTS})",
+        ],
+        edges_df.itertuples(index=False),
+    )
+    widths.apply(sheet)
+
+
+def write_changes_sheet(changes, wb):
+    """Write the connection changes from a baseline analysis to the Changes sheet"""
+    sheet = make_sheet(wb, "Changes", idx=0)
+    widths = ColumnWidths()
+
+    def append_section(title, header, rows):
+        append_sheet_section(sheet, widths, title, header, rows)
+
+    append_section(
+        "Summary",
+        [
+            "Baseline Connections",
+            "Current Connections",
+            "Added",
+            "Removed",
+            "New Hosts",
+            "New External IPs",
+            "New Services",
+        ],
+        [
+            [
+                changes.baseline_connections,
+                changes.current_connections,
+                len(changes.added),
+                len(changes.removed),
+                len(changes.new_hosts),
+                len(changes.new_external_IPs),
+                len(changes.new_services),
+            ]
+        ],
+    )
+    connection_header = ["Src_IP", "Dest_IP", "Port", "Proto", "Count"]
+    append_section(
+        "Added Connections",
+        connection_header,
+        [[*key, count] for key, count in changes.added],
+    )
+    append_section(
+        "Removed Connections",
+        connection_header,
+        [[*key, count] for key, count in changes.removed],
+    )
+    append_section("New Hosts", ["IP"], [[ip] for ip in changes.new_hosts])
+    append_section(
+        "New External IPs", ["External IP"], [[ip] for ip in changes.new_external_IPs]
+    )
+    append_section(
+        "New Services",
+        ["Proto", "Port", "Service", "Hosts", "Count"],
+        [list(service) for service in changes.new_services],
+    )
+    widths.apply(sheet)
+
 
 def write_mac_sheet(mac_df, wb):
     """Fill spreadsheet with MAC address -> IP address translation with manufacturer information"""
     sheet = make_sheet(wb, "MAC", idx=4)
-    sheet.append(
-        ["MAC", "Manufacturer", "IPs"]
-    )
+    widths = ColumnWidths()
+    header = ["MAC", "Manufacturer", "IPs", "Inventory Name"]
+    sheet.append(header)
+    widths.update(header)
     for index, row in enumerate(mac_df.to_dict(orient="records"), start=2):
+        widths.update(
+            [
+                row["mac"],
+                row["vendor"],
+                row["associated_ip"],
+                row.get("inventory_name", ""),
+            ]
+        )
         # Source MAC column
         sheet[f"A{index}"].value = row["mac"]
 
@@ -502,7 +1210,10 @@ def write_mac_sheet(mac_df, wb):
                 est_row_hght = 1
             sheet.row_dimensions[index].height = est_row_hght * 15
 
-    auto_adjust_width(sheet)
+        # Inventory Name column
+        sheet[f"D{index}"].value = row.get("inventory_name", "")
+
+    widths.apply(sheet)
     sheet.column_dimensions["C"].width = 39 * 1.2
 
 def make_sheet(wb, sheet_name, idx=None):
@@ -512,10 +1223,28 @@ def make_sheet(wb, sheet_name, idx=None):
     return wb.create_sheet(sheet_name, index=idx)
 
 
-def auto_adjust_width(sheet, width=40):
-    """Adjust the width of the columns to fit the data"""
-    for col in sheet.columns:
-        max_width = max(len(f"{c.value}") for c in col if c.value) + 2
-        sheet.column_dimensions[col[0].column_letter].width = (
-            width if width < max_width else max_width
-        )
+class ColumnWidths:
+    """Track the longest value written to each column while a sheet is filled in.
+
+    This replaces reading every cell back after writing, and also works when
+    the cells can't be re-read.
+    """
+
+    def __init__(self):
+        self.max_lengths = dict()
+
+    def update(self, values, start=1):
+        """Record the values of a row whose first value is in column start"""
+        for column, value in enumerate(values, start):
+            if value:
+                length = len(f"{value}")
+                if length > self.max_lengths.get(column, 0):
+                    self.max_lengths[column] = length
+
+    def apply(self, sheet, width=40):
+        """Adjust the width of the columns to fit the data"""
+        for column, length in self.max_lengths.items():
+            max_width = length + 2
+            sheet.column_dimensions[get_column_letter(column)].width = (
+                width if width < max_width else max_width
+            )
@@ -3,15 +3,29 @@
 # Copyright 2023 Battelle Energy Alliance, LLC
 import os
 import contextlib
+import csv
+import datetime
+import io
+import ipaddress
+import re
 from functools import wraps
 from time import monotonic
 
+import pandas as pd
 from tqdm import tqdm
 
 from navv.message_handler import info_msg, success_msg, error_msg
 from navv.validators import is_mac_address
 
 
+DNS_FIELDS = ["query", "answers", "qtype", "rcode_name"]
+DNS_CHUNK_SIZE = 500_000
+# A and AAAA answers map an address to the query name
+DNS_FORWARD_QTYPES = ("1", "28")
+# PTR answers map the address encoded in the query to the answer name
+DNS_PTR_QTYPE = "12"
+
+
 @contextlib.contextmanager
 def pushd(new_dir):
     previous_dir = os.getcwd()
@@ -33,26 +47,151 @@ def timeit(func):
             return func(*args, **kwargs)
         finally:
             end = monotonic()
+            if "timer" in kwargs:
+                kwargs["timer"][func.__name__] = f"{end - start:0.2f} seconds"
             success_msg(f"{func.__name__} execution time:\n{end - start:0.2f} seconds")
 
     return _timeit
 
 
-def trim_dns_data(data):
-    """Find entries in dns log that contain no_error and return a dict of {ip: hostname,}"""
-    ret_data = {}
-    # log_list = log_to_list(data)
+def parse_timestamp(value):
+    """Return the epoch seconds of a time given as epoch seconds or ISO 8601 (UTC unless it has an offset)"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def parse_size(value):
+    """Return the number of bytes of a size such as 512M, 2G or 1048576"""
+    units = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", value, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size {value}")
+    return int(float(match.group(1)) * units[match.group(2).upper()])
+
+
+def trim_dns_data(data, addresses=None, fields=None, separator="\t"):
+    """Find entries in dns log that contain no_error and return a dict of {ip: hostname,}
+
+    ``data`` is the zeek-cut output of DNS_FIELDS, either as bytes or as a
+    binary stream. With ``fields``, the #fields of a TSV dns.log, ``data`` is
+    the path of that log instead and its header lines are skipped. It is read
+    in chunks and filtered column-wise, so the whole log is never decoded at
+    once. A and AAAA answers take precedence over PTR answers for the same
+    address.
+
+    When ``addresses`` is given, only answers for those addresses are kept.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    read_options = dict(names=DNS_FIELDS)
+    if fields is not None:
+        read_options = dict(
+            names=fields,
+            usecols=[field for field in DNS_FIELDS if field in fields],
+            comment="#",
+        )
+
     info_msg("Trimming DNS.log data:")
-    for row in tqdm(data.decode("utf-8 ").split("\n")[:-1]):
-        # line_data = list(stream(row, '\t'))
-        line_data = row.split("\t")
-        if line_data[2] == "1" and line_data[3] == "NOERROR":
-            for split in line_data[1].split(","):
-                ret_data[split] = line_data[0]
-    return ret_data
+    forward = []
+    reverse = []
+    try:
+        chunks = pd.read_csv(
+            data,
+            sep=separator,
+            header=None,
+            dtype=str,
+            na_filter=False,
+            quoting=csv.QUOTE_NONE,
+            chunksize=DNS_CHUNK_SIZE,
+            **read_options,
+        )
+        for chunk in tqdm(chunks):
+            # fields missing from the log are empty, like zeek-cut outputs them
+            chunk = chunk.reindex(columns=DNS_FIELDS, fill_value="")
+            chunk = chunk[(chunk["rcode_name"] == "NOERROR") & (chunk["answers"] != "-")]
+            is_forward = chunk["qtype"].isin(DNS_FORWARD_QTYPES)
+            forward.append(
+                _filter_answers(
+                    _explode_answers(chunk[is_forward]).rename(
+                        columns={"answers": "ip", "query": "hostname"}
+                    ),
+                    addresses,
+                )
+            )
+            is_ptr = chunk["qtype"] == DNS_PTR_QTYPE
+            if is_ptr.any():
+                reverse.append(_filter_answers(_ptr_answers(chunk[is_ptr]), addresses))
+    except pd.errors.EmptyDataError:
+        return {}
+
+    answers = pd.concat(reverse + forward, ignore_index=True).drop_duplicates(
+        subset="ip", keep="last"
+    )
+    return dict(zip(answers["ip"], answers["hostname"]))
+
 
+def _filter_answers(answers_df, addresses):
+    """Return the answers whose ip is in addresses, or all of them if addresses is None."""
+    if addresses is None:
+        return answers_df
+    return answers_df[answers_df["ip"].isin(addresses)]
 
-def get_mac_vendor(mac_vendors: dict, mac_address: str) -> str:
+
+def _explode_answers(dns_df):
+    """Return one row per comma separated answer, deduplicated on the answer."""
+    dns_df = dns_df[["query", "answers"]].assign(
+        answers=dns_df["answers"].str.split(",")
+    )
+    return dns_df.explode("answers").drop_duplicates(subset="answers", keep="last")
+
+
+def _ptr_answers(dns_df):
+    """Return the {ip, hostname} pairs of PTR answers."""
+    ptr_df = dns_df[["query", "answers"]].drop_duplicates(subset="query", keep="last")
+    ptr_df = pd.DataFrame(
+        {
+            "ip": ptr_df["query"].map(reverse_pointer_to_ip),
+            "hostname": ptr_df["answers"].str.split(",").str[0],
+        }
+    )
+    return ptr_df[ptr_df["ip"] != ""]
+
+
+def reverse_pointer_to_ip(pointer: str) -> str:
+    """Return the IP address of an in-addr.arpa or ip6.arpa name, or "" if it is not one."""
+    labels = pointer.lower().rstrip(".").split(".")
+    if labels[-2:] == ["in-addr", "arpa"] and len(labels) == 6:
+        ip = ".".join(reversed(labels[:4]))
+    elif labels[-2:] == ["ip6", "arpa"] and len(labels) == 34:
+        ip = "".join(reversed(labels[:32]))
+        try:
+            return str(ipaddress.IPv6Address(int(ip, 16)))
+        except ValueError:
+            return ""
+    else:
+        return ""
+    try:
+        return str(ipaddress.IPv4Address(ip))
+    except ValueError:
+        return ""
+
+
+def build_mac_vendor_index(mac_vendors: list) -> dict:
+    """Return the mac vendors as {prefix length: {prefix: vendor name}}, longest prefixes first."""
+    index = dict()
+    for vendor in mac_vendors:
+        prefix = vendor["macPrefix"].upper()
+        index.setdefault(len(prefix), dict()).setdefault(prefix, vendor["vendorName"])
+    return dict(sorted(index.items(), reverse=True))
+
+
+def get_mac_vendor(mac_vendor_index: dict, mac_address: str) -> str:
     """Return the vendor of the MAC address."""
     mac_address = mac_address.upper()
 
@@ -60,14 +199,10 @@ def get_mac_vendor(mac_vendors: dict, mac_address: str) -> str:
         error_msg(f"Invalid MAC address: {mac_address}")
         return f"Bad MAC address {mac_address}"
 
-    try:
-        vendor = [
-            vendor["vendorName"]
-            for vendor in mac_vendors
-            if mac_address.startswith(vendor["macPrefix"])
-        ][0]
-    except IndexError:
-        error_msg(f"Unknown vendor for MAC address: {mac_address}")
-        return "Unknown Vendor"
-
-    return vendor
+    for length, prefixes in mac_vendor_index.items():
+        vendor = prefixes.get(mac_address[:length])
+        if vendor is not None:
+            return vendor
+
+    error_msg(f"Unknown vendor for MAC address: {mac_address}")
+    return "Unknown Vendor"
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import glob
+import os
+import pickle
+from stat import S_ISREG
+
+from navv.flow_stats import FLOW_STAT_FIELDS
+from navv.message_handler import warning_msg
+from navv.zeek import CONN_FIELDS, count_conn_records
+from navv.zeek_log import ZeekLog
+
+
+WATCH_STATE_VERSION = 1
+
+
+class LogFollower:
+    """Follow a Zeek log that is being written and rotated, reading only new lines.
+
+    The current log (e.g. conn.log) and its uncompressed rotated files (e.g.
+    conn.2023-07-22-08-00-00.log) are tracked by device and inode, so the
+    lines written just before a rotation are still read from the renamed
+    file. The byte offset reached in each file is kept in `offsets`, only up
+    to the last complete line. Compressed rotated files are never read.
+    """
+
+    def __init__(self, zeek_logs, log_name, offsets=None):
+        self.zeek_logs = zeek_logs
+        self.log_name = log_name
+        self.offsets = offsets if offsets is not None else dict()
+
+    def files(self):
+        """Return the rotated files, oldest first, then the current log"""
+        rotated = []
+        for path in glob.glob(os.path.join(self.zeek_logs, f"{self.log_name}.*.log")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed or compressed since it was listed
+                continue
+            if S_ISREG(stat.st_mode):
+                rotated.append((stat.st_mtime, path))
+        rotated.sort()
+        return [path for _, path in rotated] + [
+            os.path.join(self.zeek_logs, f"{self.log_name}.log")
+        ]
+
+    def records(self, fields):
+        """Yield the values of the fields of the lines added since the last call"""
+        seen = set()
+        for path in self.files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = (stat.st_dev, stat.st_ino)
+            if key in seen:
+                continue
+            seen.add(key)
+            offset = self.offsets.get(key, 0)
+            if stat.st_size < offset:
+                # truncated, or the inode was reused by a new file
+                offset = 0
+            if stat.st_size == offset:
+                self.offsets[key] = offset
+                continue
+            log = ZeekLog(path)
+            try:
+                end = log.complete_end()
+                start = max(offset, log.data_offset)
+                if end > start:
+                    yield from log.records(fields, chunk=(start, end))
+                self.offsets[key] = max(end, offset)
+            finally:
+                log.close()
+        # forget the files that were removed or compressed
+        for key in set(self.offsets) - seen:
+            del self.offsets[key]
+
+
+class WatchState:
+    """Connection counts and flow statistics of a watched log directory, with the offsets read so far.
+
+    The state is saved next to the report by the watch loop at most every
+    checkpoint interval, so a restarted watch resumes from the last save
+    instead of reading the logs again.
+    """
+
+    def __init__(self, path, flow_stats, conn_counts):
+        self.path = path
+        self.flow_stats = flow_stats
+        self.conn_counts = conn_counts
+        self.offsets = dict()
+
+    @classmethod
+    def load(cls, path, flow_stats, conn_counts):
+        """Return the saved state, or a new state with the given aggregates"""
+        state = cls(path, flow_stats, conn_counts)
+        try:
+            with open(path, "rb") as f:
+                saved = pickle.load(f)
+            if saved["version"] == WATCH_STATE_VERSION:
+                state.offsets = saved["offsets"]
+                state.conn_counts = saved["conn_counts"]
+                state.flow_stats = saved["flow_stats"]
+                # the Segments sheet may have changed since the state was saved
+                state.flow_stats.set_local_networks(flow_stats.local_networks)
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError) as e:
+            warning_msg(f"Ignoring unreadable watch state {path}: {e}")
+        return state
+
+    def poll(self, zeek_logs):
+        """Count the conn.log lines added since the last poll, return how many there were"""
+        before = self.flow_stats.totals[0]
+        follower = LogFollower(zeek_logs, "conn", self.offsets)
+        count_conn_records(
+            follower.records(CONN_FIELDS + FLOW_STAT_FIELDS),
+            self.conn_counts,
+            self.flow_stats,
+        )
+        return self.flow_stats.totals[0] - before
+
+    def save(self):
+        # write then rename, so an interrupted write never leaves a partial state
+        with open(f"{self.path}.tmp", "wb") as f:
+            pickle.dump(
+                {
+                    "version": WATCH_STATE_VERSION,
+                    "offsets": self.offsets,
+                    "conn_counts": self.conn_counts,
+                    "flow_stats": self.flow_stats,
+                },
+                f,
+            )
+        os.replace(f"{self.path}.tmp", self.path)
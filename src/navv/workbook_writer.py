@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import datetime
+import itertools
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.styles.differential import DifferentialStyle
+from openpyxl.writer.excel import ExcelWriter
+
+from navv.utilities import timeit
+
+try:
+    from openpyxl.worksheet._writer import (
+        ALL_TEMP_FILES,
+        WorksheetWriter,
+        create_temporary_file,
+    )
+except ImportError:
+    # an openpyxl without these internals, the workbook is saved serially
+    WorksheetWriter = None
+
+
+# zlib's default, the level openpyxl saves with
+DEFAULT_COMPRESSION_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+
+
+def can_render_in_parallel(wb):
+    """Return True if the worksheets of the workbook can be rendered by forked workers.
+
+    Rendering in parallel relies on openpyxl internals (setup.cfg pins the
+    versions it was written against) and on the workers inheriting the
+    workbook through fork, so any other openpyxl or platform saves serially.
+    """
+    return (
+        WorksheetWriter is not None
+        and "fork" in multiprocessing.get_all_start_methods()
+        and hasattr(ExcelWriter, "_write_worksheets")
+        and hasattr(wb, "_cell_styles")
+        and hasattr(wb, "_differential_styles")
+        and all(hasattr(ws, "_cells") for ws in wb.worksheets)
+    )
+
+
+def register_formats(wb):
+    """Add the formats of the conditional formatting rules to the workbook's style table.
+
+    Rendering a worksheet adds the format of every conditional formatting
+    rule to a table shared by the whole workbook. Registering them all here
+    first makes every worker find them already there and write the ids the
+    parent then saves in styles.xml. Table columns are named from their
+    header row here too, so they are saved with the tables.
+    """
+    df = DifferentialStyle()
+    for ws in wb.worksheets:
+        for cf in ws.conditional_formatting:
+            for rule in cf.rules:
+                if rule.dxf and rule.dxf != df:
+                    rule.dxfId = wb._differential_styles.add(rule.dxf)
+        for table in ws.tables.values():
+            if not table.tableColumns:
+                table._initialise_columns()
+                if table.headerRowCount:
+                    for cell, column in zip(ws[table.ref][0], table.tableColumns):
+                        column.name = str(cell.value)
+
+
+class ParallelExcelWriter(ExcelWriter):
+    """ExcelWriter that renders the worksheet XML parts in worker processes.
+
+    The workers are forked, so they inherit the workbook instead of
+    receiving a pickled copy. Rendering a worksheet adds the style of every
+    styled cell and dimension to a table shared by the whole workbook, so
+    the workers first collect the distinct styles of their worksheets, which
+    this process registers in sheet order and hands back to them. They then
+    render the parts to temporary files while this process writes them into
+    the zip archive in sheet order, so the compression of one part overlaps
+    with the rendering of the next ones.
+    """
+
+    def __init__(self, workbook, archive, workers):
+        super().__init__(workbook, archive)
+        self.workers = workers
+        self._rendered = []
+
+    def _write_worksheets(self):
+        worksheets = self.workbook.worksheets
+        paths = [create_temporary_file() for _ in worksheets]
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_render_worker,
+            initargs=(self.workbook,),
+        ) as executor:
+            # the largest sheets first, so they do not hold up the end
+            order = sorted(
+                range(len(worksheets)), key=lambda index: -len(worksheets[index]._cells)
+            )
+            styles = {
+                index: executor.submit(_collect_styles, index) for index in order
+            }
+            cell_styles = self.workbook._cell_styles
+            for index in range(len(worksheets)):
+                for style in styles[index].result():
+                    cell_styles.add(style)
+            futures = {
+                index: executor.submit(
+                    _render_worksheet, index, paths[index], cell_styles
+                )
+                for index in order
+            }
+            self._rendered = [(path, futures[index]) for index, path in enumerate(paths)]
+            super()._write_worksheets()
+
+    def write_worksheet(self, ws):
+        ws._drawing = SpreadsheetDrawing()
+        ws._drawing.charts = ws._charts
+        ws._drawing.images = ws._images
+        path, future = self._rendered[ws._id - 1]
+        ws._rels, ws._comments, rel_ids = future.result()
+        for name, rel_id in rel_ids.items():
+            ws.tables[name]._rel_id = rel_id
+        self._archive.write(path, ws.path[1:])
+        self.manifest.append(ws)
+        os.remove(path)
+        ALL_TEMP_FILES.remove(path)
+
+
+def _init_render_worker(workbook):
+    global _RENDER_WORKBOOK
+    _RENDER_WORKBOOK = workbook
+
+
+def _collect_styles(index):
+    ws = _RENDER_WORKBOOK.worksheets[index]
+    styles = dict()
+    for styled in itertools.chain(
+        ws.column_dimensions.values(), ws._cells.values(), ws.row_dimensions.values()
+    ):
+        if styled.has_style:
+            styles.setdefault(styled._style)
+    return list(styles)
+
+
+def _render_worksheet(index, path, cell_styles):
+    # the styles registered by the parent after this worker was forked
+    _RENDER_WORKBOOK._cell_styles = cell_styles
+    ws = _RENDER_WORKBOOK.worksheets[index]
+    writer = WorksheetWriter(ws, out=path)
+    writer.write()
+    rel_ids = {table.name: table._rel_id for table in ws.tables.values()}
+    return writer._rels, ws._comments, rel_ids
+
+
+@timeit
+def save_workbook(wb, file_name, workers=1, compression_level=None, **kwargs):
+    """Save the workbook, rendering its worksheets in up to `workers` forked processes.
+
+    compression_level is the deflate level of the xlsx parts, from 0 (no
+    compression, fastest) to 9 (smallest file).
+    """
+    if compression_level is None:
+        compression_level = DEFAULT_COMPRESSION_LEVEL
+    wb.properties.modified = datetime.datetime.now(
+        tz=datetime.timezone.utc
+    ).replace(tzinfo=None)
+    with ZipFile(
+        file_name, "w", ZIP_DEFLATED, allowZip64=True, compresslevel=compression_level
+    ) as archive:
+        if (
+            workers > 1
+            and len(wb.worksheets) > 1
+            and not wb.write_only
+            and can_render_in_parallel(wb)
+        ):
+            register_formats(wb)
+            writer = ParallelExcelWriter(wb, archive, workers)
+        else:
+            writer = ExcelWriter(wb, archive)
+        writer.write_data()
@@ -1,85 +1,306 @@
-import json
+import contextlib
+import hashlib
+import io
+import itertools
 import os
-from subprocess import Popen, PIPE, STDOUT, check_call
+import pickle
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from subprocess import check_call
 
+from navv.dns_store import DnsStore
+from navv.flow_stats import FLOW_STAT_FIELDS, FlowStats, to_number
 from navv.message_handler import error_msg
-from navv.utilities import pushd, timeit, trim_dns_data
+from navv.networks import to_zeek_subnet
+from navv.spill import SpillingCounter
+from navv.utilities import DNS_FIELDS, pushd, timeit, trim_dns_data
+from navv.zeek_log import ZeekLog
+
+
+CONN_FIELDS = [
+    "id.orig_h",
+    "id.resp_h",
+    "id.resp_p",
+    "proto",
+    "conn_state",
+    "orig_l2_addr",
+    "resp_l2_addr",
+]
+CONN_CHECKPOINT_VERSION = 2
+# <log key>-<task key>.pkl, or its .tmp while being written
+CHECKPOINT_NAME = re.compile(r"[0-9a-f]{16}-[0-9a-f]{40}\.pkl(\.tmp)?$")
+# snmp.log requests are aggregated on these fields, the source port is dropped
+SNMP_FIELDS = ["id.orig_h", "id.resp_h", "id.resp_p", "version", "community"]
+ZEEKCUT_BATCH_SIZE = 10000
 
 
 @timeit
-def get_conn_data(zeek_logs):
-    """Return a list of Zeek conn.log data."""
-    return (
-        perform_zeekcut(
-            fields=[
-                "id.orig_h",
-                "id.resp_h",
-                "id.resp_p",
-                "proto",
-                "conn_state",
-                "orig_l2_addr",
-                "resp_l2_addr",
-            ],
-            log_file=os.path.join(zeek_logs, "conn.log"),
+def get_conn_data(
+    zeek_logs,
+    flow_stats=None,
+    conn_counts=None,
+    start=None,
+    end=None,
+    workers=1,
+    checkpoint_dir=None,
+    index_path=None,
+    **kwargs,
+):
+    """Return a list of Zeek conn.log data.
+
+    conn.log is memory-mapped and read in chunks at line boundaries, limited
+    to the connections with start <= ts <= end. The rows are counted into
+    conn_counts, a Counter, a SpaceSaving sketch or a SpillingCounter, and
+    each counted row is returned once; without conn_counts every row is
+    returned. The rows of a SpillingCounter are not loaded, it is returned
+    as is to be iterated over. If a FlowStats
+    is given, the flow statistics are collected from the same pass.
+
+    The chunks are read by up to `workers` processes. With a checkpoint_dir,
+    the results of every chunk are saved there as soon as it is read, so an
+    interrupted run, or a later run over the same logs, only reads the
+    chunks it is missing. The checkpoints of every time window are kept
+    until conn.log changes. The conn.log index that time windows seek with
+    is saved to index_path, if given.
+    """
+    keep_rows = conn_counts is None
+    if keep_rows:
+        conn_counts = Counter()
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    conn_log = ZeekLog(os.path.join(zeek_logs, "conn.log"), index_path)
+    try:
+        chunks = conn_log.chunks(start, end)
+    finally:
+        conn_log.close()
+
+    # every chunk collects its own flow statistics with the same settings
+    stats_settings = None
+    if flow_stats is not None:
+        stats_settings = flow_stats.settings
+    # checkpoints are named after the log they were read from, then the task
+    log_key = hashlib.sha1(
+        pickle.dumps((conn_log.fingerprint, CONN_CHECKPOINT_VERSION))
+    ).hexdigest()[:16]
+    tasks = []
+    for chunk in chunks:
+        task = (conn_log.path, chunk, start, end, stats_settings)
+        checkpoint = None
+        if checkpoint_dir:
+            key = hashlib.sha1(pickle.dumps(task[1:])).hexdigest()
+            checkpoint = os.path.join(checkpoint_dir, f"{log_key}-{key}.pkl")
+        tasks.append(task + (checkpoint,))
+    if checkpoint_dir:
+        _remove_stale_checkpoints(checkpoint_dir, log_key)
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            _merge_conn_chunks(
+                executor.map(_read_conn_chunk, tasks), conn_counts, flow_stats
+            )
+    else:
+        _merge_conn_chunks(map(_read_conn_chunk, tasks), conn_counts, flow_stats)
+
+    if keep_rows:
+        return list(conn_counts.elements())
+    if isinstance(conn_counts, SpillingCounter):
+        # the rows stay on disk, every pass over them merges the spilled runs
+        return conn_counts
+    return list(conn_counts)
+
+
+def _read_conn_chunk(task):
+    """Return the Counter of rows and the FlowStats of a chunk of conn.log"""
+    log_file, chunk, start, end, stats_settings, checkpoint = task
+    if checkpoint and os.path.isfile(checkpoint):
+        try:
+            with open(checkpoint, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+    conn_counts = Counter()
+    flow_stats = FlowStats(*stats_settings) if stats_settings else None
+    conn_log = ZeekLog(log_file)
+    try:
+        count_conn_records(
+            conn_log.records(
+                CONN_FIELDS + FLOW_STAT_FIELDS, chunk=chunk, start=start, end=end
+            ),
+            conn_counts,
+            flow_stats,
         )
-        .decode("utf-8")
-        .split("\n")[:-1]
-    )
+    finally:
+        conn_log.close()
 
+    if checkpoint:
+        # write then rename, so an interrupted write never leaves a partial checkpoint
+        with open(f"{checkpoint}.tmp", "wb") as f:
+            pickle.dump((conn_counts, flow_stats), f)
+        os.replace(f"{checkpoint}.tmp", checkpoint)
+    return conn_counts, flow_stats
+
+
+def count_conn_records(records, conn_counts, flow_stats=None):
+    """Count conn.log records of CONN_FIELDS + FLOW_STAT_FIELDS into a Counter of rows"""
+    analysis_fields = len(CONN_FIELDS)
+    for cells in records:
+        conn_counts["\t".join(cells[:analysis_fields])] += 1
+        if flow_stats is not None:
+            # the flow fields, then orig_l2_addr and resp_l2_addr
+            flow_stats.add(*cells[:4], *cells[analysis_fields:], cells[5], cells[6])
+
+
+def _merge_conn_chunks(results, conn_counts, flow_stats):
+    for chunk_counts, chunk_stats in results:
+        if isinstance(conn_counts, Counter):
+            conn_counts.update(chunk_counts)
+        else:
+            for row, count in chunk_counts.items():
+                conn_counts.add(row, count)
+        if flow_stats is not None:
+            flow_stats.merge(chunk_stats)
 
-@timeit
-def get_dns_data(customer_name, output_dir, zeek_logs):
-    """Get DNS data from zeek logs or from a json file if it exists"""
-    json_path = os.path.join(output_dir, f"{customer_name}_dns_data.json")
-    if os.path.exists(json_path):
-        with open(json_path, "rb") as json_file:
-            return json.load(json_file)
 
-    dns_data = perform_zeekcut(
-        fields=["query", "answers", "qtype", "rcode_name"],
-        log_file=os.path.join(zeek_logs, "dns.log"),
-    )
-    return trim_dns_data(dns_data)
+def _remove_stale_checkpoints(checkpoint_dir, log_key):
+    """Remove the checkpoints of other versions of conn.log, keeping every time window of this one"""
+    for file_name in os.listdir(checkpoint_dir):
+        # leave alone anything else the directory holds
+        if file_name.startswith(f"{log_key}-"):
+            continue
+        if not CHECKPOINT_NAME.match(file_name):
+            continue
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(checkpoint_dir, file_name))
+
+
+def get_conn_addresses(conn_data):
+    """Return the set of unique source and destination IPs in the conn.log data."""
+    addresses = set()
+    for row in conn_data:
+        addresses.update(row.split("\t", 2)[:2])
+    return addresses
 
 
 @timeit
-def get_snmp_data(zeek_logs):
-    """Get SNMP data from zeek logs or from a json file if it exists"""
-    return (
-        perform_zeekcut(
-            fields=[
-                "id.orig_h",
-                "id.orig_p",
-                "id.resp_h",
-                "id.resp_p",
-                "version",
-                "community",
-            ],
-            log_file=os.path.join(zeek_logs, "snmp.log"),
-        )
-        .decode("utf-8")
-        .split("\n")[:-1]
-    )
+def get_dns_data(customer_name, output_dir, zeek_logs, addresses=None, **kwargs):
+    """Get DNS data from the DNS store, refreshing it from zeek logs if they changed
+
+    Passing the addresses seen in conn.log restricts the answers read from
+    dns.log to those addresses instead of every answer in dns.log. The store
+    is refreshed when the addresses differ from those of its last refresh,
+    e.g. after a run with another --start/--end window.
+    """
+    dns_store = DnsStore(os.path.join(output_dir, f"{customer_name}_dns_data.sqlite"))
+    log_files = [
+        os.path.join(zeek_logs, "dns.log"),
+        os.path.join(zeek_logs, "conn.log"),
+    ]
+    if dns_store.is_stale(log_files, addresses):
+        dns_store.merge(read_dns_log(log_files[0], addresses), log_files, addresses)
+    return dns_store
+
 
+def read_dns_log(log_file, addresses=None):
+    """Return the {ip: hostname} answers of dns.log, see trim_dns_data
 
-def perform_zeekcut(fields, log_file):
-    """Perform the call to zeek-cut with the identified fields on the specified log file"""
+    A TSV log is parsed by pandas straight from the file, a JSON log is read
+    with ZeekLog and handed over as the lines zeek-cut would output. A
+    missing log has no answers.
+    """
+    dns_log = ZeekLog(log_file)
     try:
-        with open(log_file, "rb") as f:
-            zeekcut = Popen(
-                ["zeek-cut"] + fields, stdout=PIPE, stdin=PIPE, stderr=STDOUT
+        if dns_log.is_json:
+            return trim_dns_data(
+                io.BufferedReader(IterStream(zeekcut_lines(dns_log, DNS_FIELDS))),
+                addresses,
             )
-            return zeekcut.communicate(input=f.read())[0]
-    except OSError as e:
-        # probably "file does not exist"
-        return b""
+        if not dns_log.fields:
+            return {}
+        return trim_dns_data(
+            log_file,
+            addresses,
+            fields=dns_log.fields,
+            separator=dns_log.separator.decode(),
+        )
+    finally:
+        dns_log.close()
 
 
 @timeit
-def run_zeek(pcap_path, zeek_logs_path, **kwargs):
+def get_snmp_data(zeek_logs, **kwargs):
+    """Return the snmp.log requests aggregated per (src, dst, dst_port, version, community).
+
+    Every aggregated row is the key followed by the number of requests and the
+    ts of the first and last request, busiest rows first.
+    """
+    snmp_rows = dict()
+    snmp_log = ZeekLog(os.path.join(zeek_logs, "snmp.log"))
+    try:
+        for ts, *key in snmp_log.records(["ts"] + SNMP_FIELDS):
+            ts = to_number(ts)
+            key = tuple(key)
+            row = snmp_rows.get(key)
+            if row is None:
+                snmp_rows[key] = [1, ts, ts]
+                continue
+            row[0] += 1
+            if ts < row[1]:
+                row[1] = ts
+            if ts > row[2]:
+                row[2] = ts
+    finally:
+        snmp_log.close()
+    return [
+        [*key, *row]
+        for key, row in sorted(snmp_rows.items(), key=lambda item: (-item[1][0], item[0]))
+    ]
+
+
+def zeekcut_lines(zeek_log, fields, batch_size=ZEEKCUT_BATCH_SIZE):
+    """Yield the lines zeek-cut would output for the fields of a ZeekLog, batch_size lines at a time"""
+    records = zeek_log.records(fields)
+    while True:
+        batch = ["\t".join(record) for record in itertools.islice(records, batch_size)]
+        if not batch:
+            return
+        yield ("\n".join(batch) + "\n").encode("utf-8")
+
+
+class IterStream(io.RawIOBase):
+    """Readable binary stream over an iterator of bytes"""
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.iterator)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+@timeit
+def run_zeek(pcap_path, zeek_logs_path, local_nets=(), **kwargs):
+    """Run zeek on the pcap, adding the local_nets CIDRs to Site::local_nets"""
+    zeek_args = ["zeek", "-C", "-r", pcap_path, "local.zeek"]
+    if local_nets:
+        zeek_args.append(
+            "Site::local_nets += { %s }"
+            % ", ".join(to_zeek_subnet(network) for network in local_nets)
+        )
     with pushd(zeek_logs_path):
-        # can we add Site::local_nets to the zeek call here?
         try:
-            check_call(["zeek", "-C", "-r", pcap_path, "local.zeek"])
+            check_call(zeek_args)
         except Exception as e:
             error_msg(e)
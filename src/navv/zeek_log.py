@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Battelle Energy Alliance, LLC
+import array
+import bisect
+import datetime
+import itertools
+import json
+import mmap
+import os
+import pickle
+import re
+
+from navv.dns_store import fingerprint
+
+
+LOG_INDEX_VERSION = 1
+# Lines per index block, the unit of time-window seeks and chunking
+INDEX_STRIDE = 8192
+CHUNK_SIZE = 64 * 1024 * 1024
+JSON_BATCH_SIZE = 10000
+JSON_TS = re.compile(rb'"ts":\s*("[^"]*"|[0-9.eE+-]+)')
+
+
+def to_epoch(ts):
+    """Return a JSON log ts, in epoch seconds or ISO 8601, as epoch seconds"""
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    try:
+        # fromisoformat only accepts a "Z" suffix from Python 3.11
+        if ts.endswith("Z"):
+            ts = ts[:-1] + "+00:00"
+        return datetime.datetime.fromisoformat(ts).timestamp()
+    except (AttributeError, TypeError, ValueError):
+        return float("nan")
+
+
+def to_zeek_value(value):
+    """Return a JSON log value the way it is written in TSV logs"""
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return "T" if value else "F"
+    if isinstance(value, list):
+        return ",".join(to_zeek_value(each) for each in value) or "(empty)"
+    return str(value)
+
+
+def _decode_json_lines(lines):
+    try:
+        return json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        # skip the malformed lines, e.g. a partially written last line
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+
+class ZeekLog:
+    """Memory-mapped Zeek TSV or JSON log with a sparse line offset and timestamp index.
+
+    The index records the offset of every INDEX_STRIDE-th line together with
+    the lowest and highest ts of the lines in each block. It is only built the
+    first time a time window is read, and saved to index_path if one is given
+    (otherwise it is kept in memory), so later runs can seek to a time window
+    by binary search without scanning the log.
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path
+        self.fingerprint = fingerprint(path)
+        self.separator = b"\t"
+        self.fields = []
+        self._file = None
+        self._mmap = b""
+        if os.path.isfile(path) and os.path.getsize(path):
+            self._file = open(path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        # JSON logs (LogAscii::use_json=T) have no header, one object per line
+        self.is_json = self._mmap[:1] == b"{"
+        self._read_header()
+        self.offsets = None
+
+    def _read_header(self):
+        position = 0
+        while self._mmap[position : position + 1] == b"#":
+            end = self._mmap.find(b"\n", position)
+            end = len(self._mmap) if end == -1 else end
+            self._parse_header_line(self._mmap[position:end])
+            position = end + 1
+        self.data_offset = position
+
+    def _parse_header_line(self, line):
+        if line.startswith(b"#separator "):
+            self.separator = line.split(b" ", 1)[1].decode("unicode_escape").encode()
+        elif line.startswith(b"#fields"):
+            self.fields = line.decode().split(self.separator.decode())[1:]
+
+    def _load_index(self):
+        if self.offsets is not None:
+            return
+        if self.index_path and self._read_index():
+            return
+        self._build_index()
+        if not self.index_path:
+            return
+        try:
+            with open(self.index_path, "wb") as f:
+                pickle.dump(
+                    {
+                        "version": LOG_INDEX_VERSION,
+                        "fingerprint": self.fingerprint,
+                        "offsets": self.offsets,
+                        "min_ts": self.min_ts,
+                        "max_ts": self.max_ts,
+                    },
+                    f,
+                )
+        except OSError:
+            # read-only output directory, the index only lives for this run
+            pass
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                index = pickle.load(f)
+            if (
+                index["version"] == LOG_INDEX_VERSION
+                and index["fingerprint"] == self.fingerprint
+            ):
+                self.offsets, self.min_ts, self.max_ts = (
+                    index["offsets"],
+                    index["min_ts"],
+                    index["max_ts"],
+                )
+                self._prepare_index()
+                return True
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            pass
+        return False
+
+    def _build_index(self):
+        self.offsets = array.array("Q")
+        self.min_ts = array.array("d")
+        self.max_ts = array.array("d")
+        ts_index = self.fields.index("ts") if "ts" in self.fields else None
+        if self.is_json:
+            ts_index = 0
+        data = self._mmap
+        position = self.data_offset
+        lines = 0
+        while position < len(data):
+            end = data.find(b"\n", position)
+            end = len(data) if end == -1 else end
+            if data[position : position + 1] != b"#" and end > position:
+                if lines % INDEX_STRIDE == 0:
+                    self.offsets.append(position)
+                    self.min_ts.append(float("inf"))
+                    self.max_ts.append(float("-inf"))
+                lines += 1
+                if ts_index is not None:
+                    ts = self._ts(data[position:end], ts_index)
+                    if ts < self.min_ts[-1]:
+                        self.min_ts[-1] = ts
+                    if ts > self.max_ts[-1]:
+                        self.max_ts[-1] = ts
+            position = end + 1
+        self._prepare_index()
+
+    def _ts(self, line, ts_index):
+        if self.is_json:
+            match = JSON_TS.search(line)
+            return to_epoch(json.loads(match.group(1)) if match else None)
+        try:
+            return float(line.split(self.separator, ts_index + 1)[ts_index])
+        except (IndexError, ValueError):
+            return float("nan")
+
+    def _prepare_index(self):
+        # The ts of conn.log lines are only roughly in order, so seek on the
+        # running maximum (from the start) and running minimum (from the end)
+        self.prefix_max = list(self.max_ts)
+        for block in range(1, len(self.prefix_max)):
+            self.prefix_max[block] = max(
+                self.prefix_max[block], self.prefix_max[block - 1]
+            )
+        self.suffix_min = list(self.min_ts)
+        for block in range(len(self.suffix_min) - 2, -1, -1):
+            self.suffix_min[block] = min(
+                self.suffix_min[block], self.suffix_min[block + 1]
+            )
+
+    def byte_range(self, start=None, end=None):
+        """Return the (start, end) offsets of the blocks that may hold lines with start <= ts <= end"""
+        self._load_index()
+        first_block = 0
+        last_block = len(self.offsets)
+        if start is not None:
+            first_block = bisect.bisect_left(self.prefix_max, start)
+        if end is not None:
+            last_block = bisect.bisect_right(self.suffix_min, end)
+        if first_block >= last_block:
+            return (len(self._mmap), len(self._mmap))
+        return (self.offsets[first_block], self._block_offset(last_block))
+
+    def complete_end(self):
+        """Return the offset just past the last complete line, e.g. of a log being written"""
+        return self._mmap.rfind(b"\n") + 1
+
+    def _block_offset(self, block):
+        return self.offsets[block] if block < len(self.offsets) else len(self._mmap)
+
+    def chunks(self, start=None, end=None, chunk_size=CHUNK_SIZE):
+        """Split the log, or the byte range of the time window, into chunks at line boundaries
+
+        Only a time window needs the index, the chunks of the whole log end at
+        the first line end after every chunk_size bytes.
+        """
+        if start is None and end is None:
+            boundaries = [self.data_offset]
+            while boundaries[-1] + chunk_size < len(self._mmap):
+                line_end = self._mmap.find(b"\n", boundaries[-1] + chunk_size - 1)
+                if line_end == -1:
+                    break
+                boundaries.append(line_end + 1)
+            boundaries.append(len(self._mmap))
+        else:
+            range_start, range_end = self.byte_range(start, end)
+            boundaries = [range_start]
+            for offset in self.offsets:
+                if offset <= range_start or offset >= range_end:
+                    continue
+                if offset - boundaries[-1] >= chunk_size:
+                    boundaries.append(offset)
+            boundaries.append(range_end)
+        return [
+            (chunk_start, chunk_end)
+            for chunk_start, chunk_end in zip(boundaries, boundaries[1:])
+            if chunk_end > chunk_start
+        ]
+
+    def records(self, fields, chunk=None, start=None, end=None):
+        """Yield the values of the fields for the lines of the chunk within the time window
+
+        Values are returned as they appear in TSV logs. Fields missing from a
+        TSV log are returned empty, like zeek-cut does; fields missing from a
+        JSON record are unset and returned as "-".
+        """
+        if start is None and end is None:
+            chunk = chunk or (self.data_offset, len(self._mmap))
+            window = None
+        else:
+            chunk = chunk or self.byte_range(start, end)
+            window = (
+                float("-inf") if start is None else start,
+                float("inf") if end is None else end,
+            )
+        if self.is_json:
+            return self._json_records(fields, chunk, window)
+        return self._tsv_records(fields, chunk, window)
+
+    def _lines(self, chunk):
+        chunk_start, chunk_end = chunk
+        data = self._mmap
+        position = chunk_start
+        while position < chunk_end:
+            line_end = data.find(b"\n", position, chunk_end)
+            line_end = chunk_end if line_end == -1 else line_end
+            line = data[position:line_end]
+            position = line_end + 1
+            if line.strip():
+                yield line
+
+    def _tsv_records(self, fields, chunk, window):
+        indexes = self._field_indexes(fields)
+        ts_index = self.fields.index("ts") if "ts" in self.fields else None
+        separator = self.separator.decode()
+        for line in self._lines(chunk):
+            if line.startswith(b"#"):
+                # concatenated logs repeat their header
+                self._parse_header_line(line)
+                indexes = self._field_indexes(fields)
+                ts_index = self.fields.index("ts") if "ts" in self.fields else None
+                continue
+            if window and ts_index is not None:
+                if not window[0] <= self._ts(line, ts_index) <= window[1]:
+                    continue
+            cells = line.decode("utf-8").split(separator)
+            yield [
+                cells[index] if index is not None and index < len(cells) else ""
+                for index in indexes
+            ]
+
+    def _json_records(self, fields, chunk, window):
+        # Decoding a whole batch as one JSON array is much faster than
+        # decoding every line on its own
+        batch = []
+        for line in itertools.chain(self._lines(chunk), [None]):
+            if line is not None:
+                batch.append(line)
+                if len(batch) < JSON_BATCH_SIZE:
+                    continue
+            for record in _decode_json_lines(batch):
+                ts = to_epoch(record.get("ts"))
+                if window and not window[0] <= ts <= window[1]:
+                    continue
+                if "ts" in record:
+                    # ts may be written in ISO 8601 (LogAscii::json_timestamps)
+                    record["ts"] = ts
+                yield [
+                    value if value.__class__ is str else to_zeek_value(value)
+                    for value in map(record.get, fields)
+                ]
+            batch = []
+
+    def _field_indexes(self, fields):
+        positions = {field: index for index, field in enumerate(self.fields)}
+        return [positions.get(field) for field in fields]
+
+    def close(self):
+        if self._file is not None:
+            self._mmap.close()
+            self._file.close()
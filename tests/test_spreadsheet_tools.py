@@ -0,0 +1,22 @@
+import openpyxl
+
+from navv.spreadsheet_tools import ANALYSIS_INDEX_SHEET, AnalysisSheets
+
+
+def test_segment_named_index_keeps_its_partition():
+    wb = openpyxl.Workbook()
+    sheets = AnalysisSheets(wb)
+    for key in (None, "Index", "Index"):
+        partition, row_index = sheets.next_row(key)
+        partition.sheet.cell(row=row_index, column=1, value=1)
+    sheets.close()
+
+    names = [partition.name for partition in sheets.partitions]
+    assert names == ["Analysis", "Analysis Index 2"]
+    assert wb["Analysis Index 2"].max_row == 3
+    index_sheet = wb[ANALYSIS_INDEX_SHEET]
+    assert [row for row in index_sheet.iter_rows(min_row=2, values_only=True)] == [
+        ("Analysis", "", 1),
+        ("Analysis Index 2", "Index", 2),
+    ]
+    assert index_sheet["A3"].hyperlink.target == "#'Analysis Index 2'!A1"
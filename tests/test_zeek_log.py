@@ -0,0 +1,28 @@
+import json
+import math
+
+from navv.zeek_log import ZeekLog, to_epoch
+
+
+def test_to_epoch_accepts_z_suffix():
+    assert to_epoch("2020-09-13T12:26:40Z") == 1600000000.0
+    assert to_epoch("2020-09-13T12:26:40.500000Z") == 1600000000.5
+    assert to_epoch("2020-09-13T12:26:40+00:00") == 1600000000.0
+    assert to_epoch(1600000000) == 1600000000.0
+    assert math.isnan(to_epoch(None))
+    assert math.isnan(to_epoch("not a time"))
+
+
+def test_json_log_time_window_with_z_timestamps(tmp_path):
+    path = tmp_path / "snmp.log"
+    with open(path, "w") as f:
+        for second in range(4):
+            record = {"ts": f"2020-09-13T12:26:4{second}Z", "id.orig_h": f"10.0.0.{second}"}
+            f.write(json.dumps(record) + "\n")
+
+    log = ZeekLog(str(path))
+    try:
+        records = list(log.records(["id.orig_h"], start=1600000001, end=1600000002))
+    finally:
+        log.close()
+    assert records == [["10.0.0.1"], ["10.0.0.2"]]